@@ -0,0 +1,22 @@
+import json
+import os
+import tempfile
+
+# Function to replace the content of a file at once. The content goes to a temporary file of its own per
+# writer, which then replaces the file, so readers never see a partial file and concurrent writers of
+# other threads or processes never mix their contents.
+def write_text(path, text):
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    with tempfile.NamedTemporaryFile("w", dir=directory, suffix=".tmp", delete=False) as f:
+        try:
+            f.write(text)
+        except BaseException:
+            f.close()
+            os.remove(f.name)
+            raise
+    os.replace(f.name, path)
+
+# Function to replace a JSON file at once, keyword arguments go to json.dumps
+def write_json(path, data, **kwargs):
+    write_text(path, json.dumps(data, **kwargs))
@@ -0,0 +1,199 @@
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import duckdb
+from openai import OpenAI
+
+import build_service
+import jobs
+import pipeline
+import prefetch
+import telemetry
+import workspace
+
+# Headless batch generation: runs the prompt sequence of every entry of a spec file as the turns of a chat,
+# each entry in its own workspace, on a bounded pool of workers.
+#
+#   python batch.py spec.json --workers 4 --timeout 600 --output batch-summary.json
+#
+# The spec is a JSON list of entries:
+#
+#   [{"name": "sales", "database": "my_db", "prompts": ["Create a dashboard of ...", "Add a filter by ..."],
+#     "repair_attempts": 1, "candidates": 1}]
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+BATCH_WORKERS = int(os.getenv('BATCH_WORKERS', '4'))
+# Seconds a turn may take before it is cancelled, the remaining prompts of its entry are skipped
+BATCH_JOB_TIMEOUT = float(os.getenv('BATCH_JOB_TIMEOUT', '600'))
+# Seconds a cancelled turn gets to reach its next cancellation point
+CANCEL_GRACE_PERIOD = 30
+
+SUCCEEDED = "succeeded"
+BUILD_FAILED = "build_failed"
+FAILED = "failed"
+TIMED_OUT = "timed_out"
+
+# Stands in for the build service with --no-build, e.g. on machines without npm install in my-app
+class SkippedBuild:
+    def build(self, changed_file):
+        return {"ok": True, "skipped": True, "errors": [], "duration_ms": 0.0, "output": ""}
+
+    def submit(self, changed_file):
+        future = Future()
+        future.set_result(self.build(changed_file))
+        return future
+
+def load_spec(path):
+    with open(path, "r") as f:
+        entries = json.load(f)
+    names = set()
+    for i, entry in enumerate(entries):
+        if not entry.get("database") or not entry.get("prompts"):
+            raise ValueError(f"Entry {i} of {path} needs a database and a list of prompts")
+        entry.setdefault("name", f"{entry['database']}-{i}")
+        if entry["name"] in names:
+            raise ValueError(f"Duplicate entry name in {path}: {entry['name']}")
+        names.add(entry["name"])
+    return entries
+
+def _turn_status(job):
+    if job.status == jobs.SUCCEEDED:
+        return BUILD_FAILED if job.result["error_state"] else SUCCEEDED
+    return FAILED
+
+# Function to run the prompts of one entry one after another as the turns of a chat, like main.py does.
+# A turn that fails or times out ends the entry; a build error is passed on to the next turn.
+def run_entry(entry, executor, prefetcher, client, args, trace):
+    started = time.perf_counter()
+    app_dir = workspace.create_workspace(f"batch-{args.run_id}-{entry['name']}", scaffold_dir=os.path.join(BASE_DIR, workspace.SCAFFOLD_DIR))
+    builder = SkippedBuild() if args.no_build else build_service.get_build_service(app_dir)
+    summary = {"name": entry["name"], "database": entry["database"], "workspace": os.path.abspath(app_dir), "turns": []}
+    trace = trace.bind(entry=entry["name"])
+    try:
+        if entry["database"] not in prefetcher.databases():
+            raise ValueError(f"Database {entry['database']} does not exist or is not attached")
+        catalog = prefetcher.get_catalog(entry["database"])
+        history, context_state, error_state = [], None, None
+        for i, prompt in enumerate(entry["prompts"]):
+            request = pipeline.GenerationRequest(
+                prompt=prompt,
+                history=list(history),
+                database=entry["database"],
+                catalog=catalog,
+                error_state=error_state,
+                is_first_component=i == 0,
+                context_state=context_state,
+                use_response_cache=not args.no_cache,
+                app_dir=app_dir,
+                candidates=entry.get("candidates", args.candidates),
+                repair_attempts=entry.get("repair_attempts", args.repair_attempts),
+                trace=trace.bind(turn=i),
+            )
+            job = executor.submit(entry["name"], lambda job, request=request: pipeline.run_generation(job, request, prefetcher.pool(), client, builder), pipeline.STAGES)
+            turn = {"prompt": prompt}
+            summary["turns"].append(turn)
+            if not job.wait(args.timeout):
+                job.cancel()
+                job.wait(CANCEL_GRACE_PERIOD)
+                turn.update(status=TIMED_OUT, stage=job.stage, elapsed_s=round(args.timeout, 3))
+                break
+            turn.update(status=_turn_status(job), elapsed_s=round(job.finished_at - job.started_at, 3),
+                        stage_timings={stage: round(seconds, 3) for stage, seconds in job.stage_timings.items()})
+            if job.status != jobs.SUCCEEDED:
+                turn["error"] = str(job.error) if job.error else job.status
+                break
+            result = job.result
+            turn.update(error=result["error_state"], summary=result["summary"],
+                        repair_attempts=len(result.get("repair_attempts", [])),
+                        queries_over_budget=len(result.get("query_budget", [])),
+                        preaggregations=len(result.get("preaggregations", [])),
+                        bundle_initial_gzip_kb=result["bundle"]["initial_gzip_kb"] if result.get("bundle") else None)
+            history += [{"role": "user", "content": prompt}, {"role": "assistant", "content": result["summary"]}]
+            context_state = result["context_state"]
+            error_state = result["error_state"]
+        summary["status"] = summary["turns"][-1]["status"]
+    except Exception as e:
+        # e.g. a failing connection, the other entries still run
+        summary.update(status=FAILED, error=str(e))
+    finally:
+        if not args.no_build:
+            build_service.stop_build_service(app_dir)
+    summary["elapsed_s"] = round(time.perf_counter() - started, 3)
+    print(f"{entry['name']}: {summary['status']} after {summary['elapsed_s']:.1f}s", flush=True)
+    return summary
+
+# Function to start one stub server per database, replaying the recorded completions with the database filled in
+def start_stub_servers(completions_path, databases):
+    import benchmark
+    with open(completions_path, "r") as f:
+        completions = json.load(f)
+    return {database_name: benchmark.StubCompletionServer([c.replace("{database}", database_name) for c in completions]).start()
+            for database_name in databases}
+
+# clients maps every database of the entries to the OpenAI client its turns use
+def run_batch(entries, clients, connect, args):
+    prefetcher = prefetch.CatalogPrefetcher(connect, workers=args.workers, max_databases=0)
+    for database_name in dict.fromkeys(entry["database"] for entry in entries):
+        prefetcher.catalog_future(database_name)
+    trace = telemetry.Trace("batch", run_id=args.run_id)
+    executor = jobs.JobExecutor(max_workers=args.workers)
+    started = time.perf_counter()
+    # One thread per running entry waits for its turns, the turns themselves run on the job executor
+    with ThreadPoolExecutor(max_workers=args.workers, thread_name_prefix="batch") as entry_executor:
+        summaries = list(entry_executor.map(lambda entry: run_entry(entry, executor, prefetcher, clients[entry["database"]], args, trace), entries))
+    statuses = [summary["status"] for summary in summaries]
+    return {
+        "run_id": args.run_id,
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "config": {"workers": args.workers, "timeout_s": args.timeout, "model": pipeline.MODEL, "build": not args.no_build,
+                   "candidates": args.candidates, "repair_attempts": args.repair_attempts},
+        "elapsed_s": round(time.perf_counter() - started, 3),
+        "totals": {"entries": len(summaries), **{status: statuses.count(status) for status in (SUCCEEDED, BUILD_FAILED, FAILED, TIMED_OUT)}},
+        # Timings per stage across all turns, as in the sidebar of the app
+        "timings": telemetry.summarize(trace.spans),
+        "entries": summaries,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate apps for a spec of databases and prompt sequences, without the UI")
+    parser.add_argument("spec", help="JSON list of entries with a database, a list of prompts and optionally a name")
+    parser.add_argument("--workers", type=int, default=BATCH_WORKERS, help="number of entries generated at the same time")
+    parser.add_argument("--timeout", type=float, default=BATCH_JOB_TIMEOUT, help="seconds a turn may take")
+    parser.add_argument("--candidates", type=int, default=pipeline.GENERATION_CANDIDATES)
+    parser.add_argument("--repair-attempts", type=int, default=pipeline.REPAIR_ATTEMPTS)
+    parser.add_argument("--no-build", action="store_true", help="skip building the apps, e.g. without npm install in my-app")
+    parser.add_argument("--no-cache", action="store_true", help="do not replay cached LLM responses")
+    parser.add_argument("--base-url", default=pipeline.OPENROUTER_BASE_URL, help="OpenAI compatible endpoint of the model")
+    parser.add_argument("--stub", nargs="?", const=os.path.join(BASE_DIR, 'benchmark_data', 'completions.json'),
+                        help="replay recorded completions from a local stub server instead of calling the model")
+    parser.add_argument("--output", default="batch-summary.json")
+    args = parser.parse_args()
+    args.run_id = time.strftime("%Y%m%d-%H%M%S")
+
+    entries = load_spec(args.spec)
+    # A local DuckDB file can stand in for MotherDuck, as in main.py
+    connect = lambda: duckdb.connect(database=os.getenv('MOTHERDUCK_DATABASE', 'md:'), read_only=False)
+    databases = list(dict.fromkeys(entry["database"] for entry in entries))
+    # The recorded completions query {database}, so every database gets a stub server of its own
+    servers = start_stub_servers(args.stub, databases) if args.stub else {}
+    clients = {database_name: OpenAI(api_key=os.getenv('OPENROUTER_API_KEY') or "batch",
+                                     base_url=servers[database_name].base_url if args.stub else args.base_url)
+               for database_name in databases}
+
+    try:
+        report = run_batch(entries, clients, connect, args)
+    finally:
+        for server in servers.values():
+            server.stop()
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(json.dumps(report["totals"]))
+    print(f"Summary written to {args.output}")
+    return 0 if report["totals"][SUCCEEDED] == len(entries) else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
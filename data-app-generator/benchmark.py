@@ -0,0 +1,294 @@
+import argparse
+import json
+import math
+import os
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import duckdb
+from openai import OpenAI
+
+import build_service
+import connection_pool
+import context_builder
+import generator
+import pipeline
+import schema_cache
+import workspace
+
+# Offline benchmark of one generation turn: a local OpenAI compatible server replays recorded completions
+# and a local DuckDB file with a synthetic schema stands in for MotherDuck.
+#
+#   python benchmark.py --scales 10 100 1000 --runs 5 --output report.json --compare previous.json
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+COMPLETIONS_FILE = os.path.join(BASE_DIR, 'benchmark_data', 'completions.json')
+BENCHMARK_PROMPT = "Create a dashboard of the total sales amount per region with a bar chart and a table of the largest orders"
+
+COLUMN_TYPES = ["INTEGER", "BIGINT", "DOUBLE", "VARCHAR", "DATE", "TIMESTAMP", "BOOLEAN", "DECIMAL(18,2)"]
+TABLE_TOPICS = ["orders", "customers", "events", "sessions", "invoices", "products", "shipments", "payments",
+                "tickets", "accounts", "campaigns", "clicks", "reviews", "stores", "employees", "inventory"]
+
+# Function to build a DuckDB file with num_tables tables, every one with comments, and a small sales table
+# the recorded completions query
+def create_synthetic_database(path, num_tables, seed=42):
+    rng = random.Random(seed)
+    conn = duckdb.connect(path)
+    conn.execute("CREATE TABLE sales AS SELECT i AS order_id, ['north', 'south', 'east', 'west'][i % 4 + 1] AS region, "
+                 "round(random() * 500, 2) AS amount, DATE '2024-01-01' + (i % 365)::INTEGER AS order_date FROM range(10000) t(i)")
+    conn.execute("COMMENT ON TABLE sales IS 'One row per order with its region and amount'")
+    for i in range(num_tables - 1):
+        name = f"{TABLE_TOPICS[i % len(TABLE_TOPICS)]}_{i:04d}"
+        columns = ["id BIGINT"] + [f"{TABLE_TOPICS[rng.randrange(len(TABLE_TOPICS))]}_{c} {rng.choice(COLUMN_TYPES)}"
+                                     for c in range(rng.randint(4, 12))]
+        conn.execute(f"CREATE TABLE {name} ({', '.join(columns)})")
+        conn.execute(f"COMMENT ON TABLE {name} IS 'Synthetic {TABLE_TOPICS[i % len(TABLE_TOPICS)]} table number {i}'")
+        conn.execute(f"COMMENT ON COLUMN {name}.id IS 'Primary key'")
+    conn.close()
+
+# Minimal OpenAI compatible chat completions endpoint replaying recorded responses, streamed as server-sent events.
+# Every response waits ttft_ms before it starts, and a share slow_rate of the requests is slower by slow_ms to simulate a latency tail.
+# For tests, delays_ms sets the time to first token of the first requests in order, and the requests numbered in
+# failures (from 0) are answered with an HTTP 500. The model of every request is kept in models.
+class StubCompletionServer:
+    def __init__(self, completions, ttft_ms=0, chunk_chars=40, chunk_delay_ms=0, slow_rate=0.0, slow_ms=0, seed=42,
+                 delays_ms=(), failures=()):
+        self.completions = completions
+        self.ttft_ms = ttft_ms
+        self.slow_rate = slow_rate
+        self.slow_ms = slow_ms
+        self.delays_ms = list(delays_ms)
+        self.failures = set(failures)
+        self._rng = random.Random(seed)
+        self.chunk_chars = chunk_chars
+        self.chunk_delay_ms = chunk_delay_ms
+        self.requests = 0
+        self.models = []
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), self._handler())
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self._server.server_address[1]}/v1"
+
+    def next_completion(self, model=None):
+        with self._lock:
+            index = self.requests
+            completion = self.completions[index % len(self.completions)]
+            self.requests += 1
+            self.models.append(model)
+            delay_ms = self.ttft_ms + (self.slow_ms if self._rng.random() < self.slow_rate else 0)
+            if index < len(self.delays_ms):
+                delay_ms = self.delays_ms[index]
+        return completion, delay_ms, index in self.failures
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                request = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+                text, delay_ms, fail = stub.next_completion(request.get("model"))
+                time.sleep(delay_ms / 1000)
+                if fail:
+                    self.send_response(500)
+                    self.send_header('Content-Type', 'application/json')
+                    self.end_headers()
+                    self.wfile.write(json.dumps({"error": {"message": "stub failure"}}).encode())
+                    return
+                if not request.get("stream"):
+                    body = json.dumps({"id": "stub", "object": "chat.completion", "created": int(time.time()), "model": request.get("model"),
+                                       "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": text}}]})
+                    self.send_response(200)
+                    self.send_header('Content-Type', 'application/json')
+                    self.end_headers()
+                    self.wfile.write(body.encode())
+                    return
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/event-stream')
+                self.end_headers()
+                try:
+                    for start in range(0, len(text), stub.chunk_chars):
+                        chunk = {"id": "stub", "object": "chat.completion.chunk", "created": int(time.time()), "model": request.get("model"),
+                                 "choices": [{"index": 0, "finish_reason": None, "delta": {"content": text[start:start + stub.chunk_chars]}}]}
+                        self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+                        self.wfile.flush()
+                        time.sleep(stub.chunk_delay_ms / 1000)
+                    self.wfile.write(b"data: [DONE]\n\n")
+                except (BrokenPipeError, ConnectionResetError):
+                    # The client closed the stream early, e.g. a cancelled turn
+                    pass
+
+        return Handler
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+def _summarize(samples):
+    samples_ms = sorted(s * 1000 for s in samples)
+    return {
+        "runs": len(samples_ms),
+        "mean_ms": round(statistics.fmean(samples_ms), 3),
+        "p50_ms": round(statistics.median(samples_ms), 3),
+        # Nearest rank, the tail that LLM_HEDGING is meant to cut
+        "p95_ms": round(samples_ms[max(0, math.ceil(0.95 * len(samples_ms)) - 1)], 3),
+        "min_ms": round(samples_ms[0], 3),
+        "max_ms": round(samples_ms[-1], 3),
+    }
+
+# Function to time every stage of a turn runs times against a database of num_tables tables
+def benchmark_scale(work_dir, num_tables, runs, server, build):
+    database_name = f"bench_{num_tables}"
+    database_path = os.path.join(work_dir, f"{database_name}.duckdb")
+    started = time.perf_counter()
+    create_synthetic_database(database_path, num_tables)
+    setup_s = time.perf_counter() - started
+
+    conn = duckdb.connect(database_path)
+    pool = connection_pool.CursorPool(conn)
+    client = OpenAI(api_key="benchmark", base_url=server.base_url)
+    app_dir = workspace.create_workspace(f"benchmark-{num_tables}", scaffold_dir=os.path.join(BASE_DIR, workspace.SCAFFOLD_DIR))
+    builder = build_service.BuildService(app_dir) if build else None
+    timings = {stage: [] for stage in ["schema_fetch_cold", "schema_fetch_warm", "prompt_assembly", "llm_ttft",
+                                       "llm_total", "extract_component", "file_write", "build"]}
+    prompt_tokens = None
+
+    try:
+        for _ in range(runs):
+            shutil.rmtree(schema_cache.SCHEMA_CACHE_DIR, ignore_errors=True)
+            with pool.cursor() as cursor:
+                started = time.perf_counter()
+                catalog = schema_cache.get_catalog(cursor, database_name)
+                timings["schema_fetch_cold"].append(time.perf_counter() - started)
+                started = time.perf_counter()
+                catalog = schema_cache.get_catalog(cursor, database_name)
+                timings["schema_fetch_warm"].append(time.perf_counter() - started)
+
+            started = time.perf_counter()
+            request = pipeline.GenerationRequest(prompt=BENCHMARK_PROMPT, history=[], database=database_name,
+                                                 catalog=catalog, app_dir=app_dir)
+            internal_prompt = pipeline.build_internal_prompt(pool, request)
+            messages, token_counts, _ = context_builder.build_messages(generator.generator_prompt, [], internal_prompt)
+            timings["prompt_assembly"].append(time.perf_counter() - started)
+            prompt_tokens = token_counts["total"]
+
+            started = time.perf_counter()
+            response = ""
+            for delta in pipeline.stream_completion(client, messages):
+                if not response:
+                    timings["llm_ttft"].append(time.perf_counter() - started)
+                response += delta
+            timings["llm_total"].append(time.perf_counter() - started)
+
+            started = time.perf_counter()
+            _, component_code, _ = generator.extract_component(response)
+            timings["extract_component"].append(time.perf_counter() - started)
+
+            started = time.perf_counter()
+            with open(request.component_path, "w") as f:
+                f.write(component_code)
+            timings["file_write"].append(time.perf_counter() - started)
+
+            if builder is not None:
+                result = builder.build(request.component_path)
+                if not result["ok"]:
+                    print(build_service.format_build_errors(result, app_dir))
+                timings["build"].append(result["duration_ms"] / 1000)
+    finally:
+        if builder is not None:
+            builder.stop()
+        conn.close()
+
+    return {
+        "tables": num_tables,
+        "setup_s": round(setup_s, 3),
+        "prompt_tokens": prompt_tokens,
+        "stages": {stage: _summarize(samples) for stage, samples in timings.items() if samples},
+    }
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+# Function to print the change of every stage's p50 between two reports
+def compare_reports(previous, current):
+    for scale, result in current["scales"].items():
+        previous_stages = previous.get("scales", {}).get(scale, {}).get("stages", {})
+        for stage, summary in result["stages"].items():
+            if stage not in previous_stages:
+                continue
+            before, after = previous_stages[stage]["p50_ms"], summary["p50_ms"]
+            change = (after - before) / before * 100 if before else 0.0
+            print(f"{scale:>6} tables  {stage:<20} {before:>10.2f} ms -> {after:>10.2f} ms  ({change:+.1f}%)")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark a generation turn offline, against a stub LLM and local DuckDB")
+    parser.add_argument("--scales", type=int, nargs="+", default=[10, 100, 1000], help="number of tables of the synthetic databases")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--ttft-ms", type=float, default=0, help="simulated time to first token of the stub")
+    parser.add_argument("--chunk-delay-ms", type=float, default=0, help="simulated delay between streamed chunks")
+    parser.add_argument("--slow-rate", type=float, default=0, help="share of stub requests that are slow, e.g. 0.1")
+    parser.add_argument("--slow-ms", type=float, default=0, help="extra time to first token of the slow requests")
+    parser.add_argument("--build", action="store_true", help="also build the app, requires npm install in my-app")
+    parser.add_argument("--output", default="benchmark-report.json")
+    parser.add_argument("--compare", help="previous report to compare the results with")
+    args = parser.parse_args()
+
+    with open(COMPLETIONS_FILE, "r") as f:
+        recorded = json.load(f)
+
+    work_dir = tempfile.mkdtemp(prefix="app-generator-benchmark-")
+    # Keep caches and workspaces of the benchmark apart from the ones of the app
+    schema_cache.SCHEMA_CACHE_DIR = os.path.join(work_dir, "schema")
+    workspace.WORKSPACES_DIR = os.path.join(work_dir, "workspaces")
+    report = {
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "commit": _git_commit(),
+        "python": platform.python_version(),
+        "duckdb": duckdb.__version__,
+        "config": {"runs": args.runs, "ttft_ms": args.ttft_ms, "chunk_delay_ms": args.chunk_delay_ms, "build": args.build,
+                   "slow_rate": args.slow_rate, "slow_ms": args.slow_ms, "hedging": pipeline.llm_requests.LLM_HEDGING_ENABLED,
+                   "schema_token_budget": pipeline.schema_index.SCHEMA_TOKEN_BUDGET},
+        "scales": {},
+    }
+    try:
+        for num_tables in args.scales:
+            completions = [c.replace("{database}", f"bench_{num_tables}") for c in recorded]
+            server = StubCompletionServer(completions, ttft_ms=args.ttft_ms, chunk_delay_ms=args.chunk_delay_ms,
+                                          slow_rate=args.slow_rate, slow_ms=args.slow_ms).start()
+            try:
+                print(f"Benchmarking {num_tables} tables...")
+                report["scales"][str(num_tables)] = benchmark_scale(work_dir, num_tables, args.runs, server, args.build)
+            finally:
+                server.stop()
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(json.dumps(report["scales"], indent=2))
+    print(f"Report written to {args.output}")
+    if args.compare:
+        with open(args.compare, "r") as f:
+            compare_reports(json.load(f), report)
+
+if __name__ == "__main__":
+    main()
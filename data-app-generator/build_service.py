@@ -0,0 +1,166 @@
+import json
+import os
+import queue
+import re
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import component_history
+
+BUILD_SERVICE_ENABLED = os.getenv('BUILD_SERVICE', '1') == '1'
+BUILD_TIMEOUT = int(os.getenv('BUILD_TIMEOUT', '120'))
+# Build workers running at the same time, the least recently used one is stopped to make room for another
+BUILD_SERVICE_MAX = int(os.getenv('BUILD_SERVICE_MAX', '8'))
+
+# Matches locations like "/path/src/components/MyApp.jsx:12:4" in Vite's error output
+ERROR_LOCATION_PATTERN = re.compile(r'([^\s:"\']+\.(?:jsx?|tsx?|css)):(\d+):(\d+)')
+
+# Function to run a one-off npm run build, used when the build service is disabled or unavailable
+def run_npm_build(app_dir):
+    start = time.monotonic()
+    result = subprocess.run(['npm', 'run', 'build'], cwd=app_dir, capture_output=True, text=True)
+    duration_ms = int((time.monotonic() - start) * 1000)
+    if result.returncode == 0:
+        return {"ok": True, "errors": [], "duration_ms": duration_ms, "output": result.stdout}
+
+    error = {"file": None, "line": None, "column": None, "message": result.stderr.strip(), "frame": None}
+    match = ERROR_LOCATION_PATTERN.search(result.stderr)
+    if match:
+        error.update(file=match.group(1), line=int(match.group(2)), column=int(match.group(3)))
+    return {"ok": False, "errors": [error], "duration_ms": duration_ms, "output": result.stderr}
+
+# Function to turn the errors of a build result into the message shown to the user and sent to the model
+def format_build_errors(result, app_dir):
+    lines = ["Error building app:"]
+    for error in result["errors"]:
+        location = ""
+        if error["file"]:
+            location = os.path.relpath(error["file"], os.path.abspath(app_dir)) if os.path.isabs(error["file"]) else error["file"]
+            if error["line"] is not None:
+                location += f":{error['line']}:{error['column']}"
+            location += ": "
+        lines.append(f"{location}{error['message']}")
+        if error.get("frame"):
+            lines.append(error["frame"])
+    return "\n".join(lines)
+
+# Long-lived wrapper around my-app/build-server.js, which keeps Vite warm in watch mode
+# and only recompiles the modules that changed since the previous build
+class BuildService:
+    def __init__(self, app_dir):
+        self.app_dir = app_dir
+        self.process = None
+        self.responses = queue.Queue()
+        self.lock = threading.Lock()
+        self.next_id = 0
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.last_used = time.monotonic()
+        # Set once the service made room for another one; it no longer starts a worker
+        self.evicted = False
+
+    def _ensure_started(self):
+        if self.process is not None and self.process.poll() is None:
+            return
+        self.process = subprocess.Popen(['node', 'build-server.js'], cwd=self.app_dir,
+                                        stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True, bufsize=1)
+        self.responses = queue.Queue()
+        threading.Thread(target=self._read_responses, args=(self.process, self.responses), daemon=True).start()
+
+    @staticmethod
+    def _read_responses(process, responses):
+        for line in process.stdout:
+            try:
+                responses.put(json.loads(line))
+            except ValueError:
+                print("build-server:", line.rstrip())
+        responses.put(None)
+
+    # Function to wait for the build that includes the latest change to changed_file. A component that
+    # was built before in the same scaffold is not waited for, its cached build result is returned.
+    # dist_dir of the result is the output of the build, in the workspace or in the artifact cache.
+    def build(self, changed_file):
+        dist_dir = os.path.join(self.app_dir, 'dist')
+        if not component_history.ARTIFACT_CACHE_ENABLED:
+            return {**self._build(changed_file), "dist_dir": dist_dir}
+        with open(changed_file, "r") as f:
+            component_code = f.read()
+        key = component_history.artifact_key(self.app_dir, component_code)
+        with self.lock:
+            cached = component_history.get_artifact(key)
+            if cached is not None:
+                # A running watcher rebuilds dist on its own after the change, otherwise it is restored
+                if self.process is None or self.process.poll() is not None:
+                    component_history.restore_dist(key, self.app_dir)
+                return {**cached, "duration_ms": 0, "saved_ms": cached["duration_ms"], "cached": True,
+                        "dist_dir": component_history.artifact_dist_dir(key)}
+        result = self._build(changed_file)
+        component_history.put_artifact(key, self.app_dir, component_code, result)
+        return {**result, "dist_dir": dist_dir}
+
+    def _build(self, changed_file):
+        if not BUILD_SERVICE_ENABLED or self.evicted:
+            return run_npm_build(self.app_dir)
+        with self.lock:
+            try:
+                self._ensure_started()
+                self.next_id += 1
+                request_id = self.next_id
+                since = os.stat(changed_file).st_mtime * 1000
+                self.process.stdin.write(json.dumps({"id": request_id, "since": since}) + "\n")
+                self.process.stdin.flush()
+
+                deadline = time.monotonic() + BUILD_TIMEOUT
+                while True:
+                    response = self.responses.get(timeout=max(0, deadline - time.monotonic()))
+                    if response is None:
+                        raise RuntimeError("build server exited")
+                    if response.get("id") == request_id:
+                        return {"ok": response["ok"], "errors": response["errors"],
+                                "duration_ms": response["duration_ms"], "output": ""}
+            except (OSError, RuntimeError, queue.Empty) as e:
+                print(f"Build service unavailable ({str(e) or 'timeout'}), falling back to npm run build")
+                self.stop()
+                return run_npm_build(self.app_dir)
+
+    def submit(self, changed_file):
+        return self.executor.submit(self.build, changed_file)
+
+    def stop(self):
+        if self.process is not None and self.process.poll() is None:
+            self.process.kill()
+            self.process.wait()
+        self.process = None
+
+_services = {}
+_services_lock = threading.Lock()
+
+def _stop_service(service):
+    with service.lock:
+        service.stop()
+
+# Function to return the build service of an app directory, one per workspace. At most BUILD_SERVICE_MAX
+# services run, creating another one stops the least recently used. A job still holding an evicted
+# service builds with npm run build instead of starting its worker again.
+def get_build_service(app_dir, max_services=BUILD_SERVICE_MAX):
+    app_dir = os.path.normpath(app_dir)
+    with _services_lock:
+        if app_dir not in _services:
+            while _services and len(_services) >= max_services:
+                least_recently_used = min(_services, key=lambda key: _services[key].last_used)
+                evicted = _services.pop(least_recently_used)
+                evicted.evicted = True
+                print(f"Stopping the build service of {evicted.app_dir}, more than {max_services} are running")
+                # A build in progress finishes first, without holding up this call
+                threading.Thread(target=_stop_service, args=(evicted,), daemon=True).start()
+            _services[app_dir] = BuildService(app_dir)
+        service = _services[app_dir]
+        service.last_used = time.monotonic()
+        return service
+
+def stop_build_service(app_dir):
+    with _services_lock:
+        service = _services.pop(os.path.normpath(app_dir), None)
+    if service is not None:
+        _stop_service(service)
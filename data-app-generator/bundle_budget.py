@@ -0,0 +1,126 @@
+import gzip
+import json
+import os
+import threading
+import time
+
+from component_history import HISTORY_DIR
+
+# off, warn (report only) or fail (treat a build over budget like a build error, so it is repaired)
+BUNDLE_BUDGET_MODE = os.getenv('BUNDLE_BUDGET', 'warn')
+# Gzipped JavaScript and CSS loaded before the app renders, and of any single chunk, in KB
+BUNDLE_BUDGET_INITIAL_KB = float(os.getenv('BUNDLE_BUDGET_INITIAL_KB', '600'))
+BUNDLE_BUDGET_CHUNK_KB = float(os.getenv('BUNDLE_BUDGET_CHUNK_KB', '350'))
+
+# Vite 5 writes the manifest into .vite, earlier versions into the root of dist
+MANIFEST_PATHS = [os.path.join('.vite', 'manifest.json'), 'manifest.json']
+# Sizes of every build of a workspace, one JSON object per line, kept with its component history
+SIZES_LOG = os.path.join(HISTORY_DIR, 'bundle_sizes.jsonl')
+LARGEST_CHUNKS_SHOWN = 5
+
+_lock = threading.Lock()
+
+def load_manifest(dist_dir):
+    for path in MANIFEST_PATHS:
+        try:
+            with open(os.path.join(dist_dir, path), "r") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            continue
+    return None
+
+def _initial_keys(manifest):
+    # Entries and everything they import statically are loaded before the app renders
+    keys = set()
+    pending = [key for key, chunk in manifest.items() if chunk.get("isEntry")]
+    while pending:
+        key = pending.pop()
+        if key in keys or key not in manifest:
+            continue
+        keys.add(key)
+        pending.extend(manifest[key].get("imports", []))
+    return keys
+
+def _file_sizes(dist_dir, file_name, compress):
+    with open(os.path.join(dist_dir, file_name), "rb") as f:
+        data = f.read()
+    return len(data), len(gzip.compress(data, compresslevel=6)) if compress else None
+
+# Function to measure the chunks listed in the Vite manifest of a build: size and gzipped size of every
+# JavaScript and CSS file, and whether it is loaded initially or on demand. Other assets, e.g. the
+# WASM binaries, are fetched when they are used and only counted in assets_kb.
+def measure(dist_dir):
+    manifest = load_manifest(dist_dir)
+    if manifest is None:
+        return None
+    initial_keys = _initial_keys(manifest)
+    chunks = {}
+    assets_bytes = 0
+    for key, chunk in manifest.items():
+        initial = key in initial_keys
+        for file_name in [chunk["file"]] + chunk.get("css", []):
+            if file_name in chunks or not file_name.endswith((".js", ".css")):
+                continue
+            try:
+                size, gzip_size = _file_sizes(dist_dir, file_name, compress=True)
+            except OSError:
+                continue
+            chunks[file_name] = {"file": file_name, "source": key, "kb": round(size / 1024, 1),
+                                 "gzip_kb": round(gzip_size / 1024, 1), "initial": initial}
+        for file_name in chunk.get("assets", []):
+            try:
+                assets_bytes += _file_sizes(dist_dir, file_name, compress=False)[0]
+            except OSError:
+                continue
+    chunks = sorted(chunks.values(), key=lambda c: c["gzip_kb"], reverse=True)
+    return {
+        "chunks": chunks,
+        "initial_gzip_kb": round(sum(c["gzip_kb"] for c in chunks if c["initial"]), 1),
+        "lazy_gzip_kb": round(sum(c["gzip_kb"] for c in chunks if not c["initial"]), 1),
+        "total_kb": round(sum(c["kb"] for c in chunks), 1),
+        "assets_kb": round(assets_bytes / 1024, 1),
+    }
+
+# Function to compare the sizes of a build with the budget, returns one message per exceeded limit
+def check_budget(report, initial_kb=BUNDLE_BUDGET_INITIAL_KB, chunk_kb=BUNDLE_BUDGET_CHUNK_KB):
+    violations = []
+    if report["initial_gzip_kb"] > initial_kb:
+        violations.append(f"The app loads {report['initial_gzip_kb']:.0f} KB of gzipped JavaScript and CSS before it renders, "
+                          f"over the budget of {initial_kb:.0f} KB")
+    for chunk in report["chunks"]:
+        if chunk["gzip_kb"] > chunk_kb:
+            violations.append(f"Chunk {chunk['file']} ({chunk['source']}) is {chunk['gzip_kb']:.0f} KB gzipped, over the budget of {chunk_kb:.0f} KB per chunk")
+    return violations
+
+def format_violations(report):
+    lines = ["The app is over its bundle size budget:"] + [f"- {violation}" for violation in report["violations"]]
+    lines.append("Largest chunks: " + ", ".join(f"{c['source']} {c['gzip_kb']:.0f} KB" for c in report["chunks"][:LARGEST_CHUNKS_SHOWN]))
+    lines.append("Load charts lazily with React.lazy and Suspense, import icons by name from lucide-react, "
+                 "and only import the shadcn components the app uses.")
+    return "\n".join(lines)
+
+# Function to measure a build, check it against the budget and append it to the sizes log of the workspace.
+# Returns the report, or None if the budget is off or the build has no manifest.
+def record_build(app_dir, dist_dir, component_hash=None):
+    if BUNDLE_BUDGET_MODE == 'off':
+        return None
+    report = measure(dist_dir)
+    if report is None:
+        return None
+    report["violations"] = check_budget(report)
+    report["status"] = "ok" if not report["violations"] else BUNDLE_BUDGET_MODE
+    entry = {"created_at": time.time(), "component_hash": component_hash, **report}
+    log_path = os.path.join(app_dir, SIZES_LOG)
+    with _lock:
+        os.makedirs(os.path.dirname(log_path), exist_ok=True)
+        with open(log_path, "a") as f:
+            f.write(json.dumps(entry) + "\n")
+    return report
+
+# Function to return the sizes of every recorded build of a workspace, oldest first
+def load_history(app_dir):
+    try:
+        with open(os.path.join(app_dir, SIZES_LOG), "r") as f:
+            return [json.loads(line) for line in f if line.strip()]
+    except (OSError, ValueError):
+        return []
@@ -0,0 +1,4 @@
+# Raised at the cancellation points of a job, e.g. when a newer prompt supersedes it. Shared by jobs.py,
+# which raises it, and telemetry.py, which records the spans it ends as cancelled.
+class JobCancelled(Exception):
+    pass
@@ -0,0 +1,172 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+import atomic_files
+
+ARTIFACT_CACHE_ENABLED = os.getenv('ARTIFACT_CACHE', '1') == '1'
+ARTIFACT_CACHE_DIR = os.getenv('ARTIFACT_CACHE_DIR', '.cache/artifacts')
+ARTIFACT_CACHE_MAX_BYTES = int(os.getenv('ARTIFACT_CACHE_MAX_MB', '200')) * 1024 * 1024
+
+# Versions of a workspace's component are kept in the workspace, so they go away with it
+HISTORY_DIR = '.history'
+HISTORY_FILE = 'versions.json'
+COMPONENT_FILE = os.path.join('src', 'components', 'MyApp.jsx')
+# Not part of the build inputs of a workspace
+IGNORED_ENTRIES = {'node_modules', 'dist', HISTORY_DIR, '.last_used', '.cursorrules'}
+
+_lock = threading.Lock()
+
+def component_hash(component_code):
+    return hashlib.sha256(component_code.encode()).hexdigest()[:16]
+
+# Function to fingerprint everything a build reads besides the component: the scaffold files of the
+# workspace, by path, size and modification time. Workspaces copy the scaffold with its modification times,
+# so unchanged workspaces share their builds, and a file edited in place changes the key.
+def inputs_hash(app_dir):
+    digest = hashlib.sha256()
+    component_path = os.path.normpath(COMPONENT_FILE)
+    for root, dirs, files in os.walk(app_dir):
+        relative_root = os.path.relpath(root, app_dir)
+        if relative_root == '.':
+            dirs[:] = [d for d in dirs if d not in IGNORED_ENTRIES]
+            files = [f for f in files if f not in IGNORED_ENTRIES]
+        dirs.sort()
+        for name in sorted(files):
+            relative_path = os.path.normpath(os.path.join(relative_root, name))
+            if relative_path == component_path:
+                continue
+            try:
+                stat = os.stat(os.path.join(root, name))
+            except OSError:
+                continue
+            digest.update(f"{relative_path}\0{stat.st_size}\0{stat.st_mtime_ns}\n".encode())
+    return digest.hexdigest()
+
+# Function to compute the content address of the build of a component in a workspace
+def artifact_key(app_dir, component_code):
+    return hashlib.sha256(f"{inputs_hash(app_dir)}\0{component_hash(component_code)}".encode()).hexdigest()[:32]
+
+def _artifact_dir(key):
+    return os.path.join(ARTIFACT_CACHE_DIR, key)
+
+def artifact_dist_dir(key):
+    return os.path.join(_artifact_dir(key), 'dist')
+
+# Function to return the build result cached for a key, or None
+def get_artifact(key):
+    path = _artifact_dir(key)
+    try:
+        with open(os.path.join(path, "build.json"), "r") as f:
+            build_result = json.load(f)
+    except (OSError, ValueError):
+        return None
+    # The modification time is the last access time used for LRU eviction
+    try:
+        os.utime(path)
+    except OSError:
+        # Evicted since it was read
+        pass
+    return build_result
+
+# Function to keep the dist output of a successful build under its content address
+def put_artifact(key, app_dir, component_code, build_result):
+    dist_dir = os.path.join(app_dir, 'dist')
+    if not build_result["ok"] or not os.path.isdir(dist_dir):
+        return
+    path = _artifact_dir(key)
+    if os.path.isdir(path):
+        return
+    os.makedirs(ARTIFACT_CACHE_DIR, exist_ok=True)
+    # A directory of its own per writer, renamed into place once complete. Eviction skips it.
+    tmp_path = tempfile.mkdtemp(dir=ARTIFACT_CACHE_DIR, suffix=".tmp")
+    try:
+        shutil.copytree(dist_dir, os.path.join(tmp_path, 'dist'))
+        with open(os.path.join(app_dir, COMPONENT_FILE), "r") as f:
+            if f.read() != component_code:
+                raise OSError("component changed while its build was stored")
+        with open(os.path.join(tmp_path, "build.json"), "w") as f:
+            json.dump({"ok": True, "errors": [], "duration_ms": build_result["duration_ms"], "output": ""}, f)
+        os.rename(tmp_path, path)
+    except OSError:
+        # Stored concurrently, or dist changed while it was copied
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        return
+    with _lock:
+        evict()
+
+# Function to replace the dist output of a workspace with a cached one
+def restore_dist(key, app_dir):
+    dist_dir = os.path.join(app_dir, 'dist')
+    tmp_dir = os.path.join(tempfile.mkdtemp(dir=app_dir, prefix="dist.", suffix=".tmp"), 'dist')
+    try:
+        shutil.copytree(artifact_dist_dir(key), tmp_dir)
+    except OSError:
+        shutil.rmtree(os.path.dirname(tmp_dir), ignore_errors=True)
+        raise
+    shutil.rmtree(dist_dir, ignore_errors=True)
+    os.rename(tmp_dir, dist_dir)
+    os.rmdir(os.path.dirname(tmp_dir))
+
+def _tree_size(path):
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, files in os.walk(path) for name in files)
+
+# Function to remove the least recently used artifacts until the cache fits its size limit
+def evict(max_bytes=ARTIFACT_CACHE_MAX_BYTES):
+    try:
+        names = [name for name in os.listdir(ARTIFACT_CACHE_DIR) if not name.endswith(".tmp")]
+    except OSError:
+        return
+    entries = []
+    for name in names:
+        path = _artifact_dir(name)
+        try:
+            entries.append((os.path.getmtime(path), _tree_size(path), name))
+        except OSError:
+            continue
+    total_bytes = sum(size for _, size, _ in entries)
+    for _, size, name in sorted(entries):
+        if total_bytes <= max_bytes:
+            break
+        shutil.rmtree(_artifact_dir(name), ignore_errors=True)
+        total_bytes -= size
+
+def _history_path(app_dir):
+    return os.path.join(app_dir, HISTORY_DIR, HISTORY_FILE)
+
+# Function to return the versions of a workspace's component, oldest first
+def list_versions(app_dir):
+    try:
+        with open(_history_path(app_dir), "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return []
+
+# Function to add the component of a turn to the history of its workspace. A version that is already
+# in the history moves to the end, e.g. after a rollback or when the model returns the same component.
+def record_version(app_dir, component_code, prompt="", ok=None):
+    version_hash = component_hash(component_code)
+    history_dir = os.path.join(app_dir, HISTORY_DIR)
+    os.makedirs(history_dir, exist_ok=True)
+    source_path = os.path.join(history_dir, f"{version_hash}.jsx")
+    if not os.path.exists(source_path):
+        atomic_files.write_text(source_path, component_code)
+    with _lock:
+        versions = [v for v in list_versions(app_dir) if v["hash"] != version_hash]
+        version = {"hash": version_hash, "prompt": prompt, "ok": ok, "created_at": time.time()}
+        versions.append(version)
+        atomic_files.write_json(_history_path(app_dir), versions, indent=2)
+    return version
+
+# Function to write an earlier version back to the component of a workspace, returns its code.
+# Building it afterwards finds its artifact, so a rollback needs neither the model nor a build.
+def rollback(app_dir, version_hash):
+    with open(os.path.join(app_dir, HISTORY_DIR, f"{version_hash}.jsx"), "r") as f:
+        component_code = f.read()
+    with open(os.path.join(app_dir, COMPONENT_FILE), "w") as f:
+        f.write(component_code)
+    return component_code
@@ -0,0 +1,211 @@
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+
+import duckdb
+
+SQL_VALIDATION_ENABLED = os.getenv('SQL_VALIDATION', '1') == '1'
+SQL_VALIDATION_WORKERS = int(os.getenv('SQL_VALIDATION_WORKERS', '4'))
+
+QUERY_CALL_PATTERN = re.compile(r'\b(?:safeEvaluateQuery|evaluateQuery|runQuery|useQuery)\s*\(\s*')
+# Errors that point at the query itself; other errors (e.g. conversions of our placeholder values) are ignored
+QUERY_ERRORS = (duckdb.ParserException, duckdb.BinderException, duckdb.CatalogException)
+# Estimated cardinalities in EXPLAIN output, "EC: 123" up to DuckDB 1.0 and "~123 Rows" since 1.1
+ESTIMATE_PATTERN = re.compile(r'EC:\s*(\d+)|~(\d+)\s+Rows')
+AGGREGATE_OPERATOR_PATTERN = re.compile(r'\b(HASH_GROUP_BY|PERFECT_HASH_GROUP_BY|UNGROUPED_AGGREGATE)\b')
+# Escape sequences of JavaScript string and template literals
+ESCAPE_PATTERN = re.compile(r'\\(?:u\{([0-9a-fA-F]+)\}|u([0-9a-fA-F]{4})|x([0-9a-fA-F]{2})|(\r\n|[\s\S]))')
+SINGLE_CHARACTER_ESCAPES = {'n': '\n', 'r': '\r', 't': '\t', 'b': '\b', 'f': '\f', 'v': '\v', '0': '\0',
+                            '\n': '', '\r\n': '', '\u2028': '', '\u2029': ''}
+
+@dataclass
+class EmbeddedQuery:
+    sql: str
+    # Offsets of the query text (without quotes) in the component code
+    start: int
+    end: int
+    line: int
+    placeholders: list = field(default_factory=list)
+
+    # The SQL as the browser sends it, with the escape sequences of the literal decoded
+    @property
+    def text(self):
+        return decode_literal(self.sql)
+
+# Function to find the end of a string or template literal starting at code[start], returns the index after it
+def _scan_literal(code, start):
+    quote = code[start]
+    i = start + 1
+    while i < len(code):
+        char = code[i]
+        if char == '\\':
+            i += 2
+            continue
+        if char == quote:
+            return i + 1
+        if quote == '`' and code.startswith('${', i):
+            i = _scan_expression(code, i + 2)
+            continue
+        i += 1
+    return len(code)
+
+# Function to find the end of a ${...} expression, returns the index after the closing brace
+def _scan_expression(code, start):
+    depth = 1
+    i = start
+    while i < len(code):
+        char = code[i]
+        if char in '\'"`':
+            i = _scan_literal(code, i)
+            continue
+        if char == '{':
+            depth += 1
+        elif char == '}':
+            depth -= 1
+            if depth == 0:
+                return i + 1
+        i += 1
+    return len(code)
+
+def _literal_at(code, start):
+    end = _scan_literal(code, start)
+    return start + 1, end - 1
+
+def _decode_escape(match):
+    code_point, unit, byte, char = match.groups()
+    if char is not None:
+        return SINGLE_CHARACTER_ESCAPES.get(char, char)
+    return chr(int(code_point or unit or byte, 16))
+
+# Function to decode the escape sequences of the raw text of a literal, e.g. \' or \n. ${...} placeholders
+# are JavaScript and kept as they are.
+def decode_literal(text):
+    parts = []
+    previous_end = 0
+    for start, end in _placeholders(text):
+        parts.append(ESCAPE_PATTERN.sub(_decode_escape, text[previous_end:start]))
+        parts.append(text[start:end])
+        previous_end = end
+    parts.append(ESCAPE_PATTERN.sub(_decode_escape, text[previous_end:]))
+    return ''.join(parts)
+
+# Function to escape text for a literal delimited by quote_char, the inverse of decode_literal
+def encode_literal(text, quote_char):
+    text = text.replace('\\', '\\\\').replace(quote_char, '\\' + quote_char)
+    if quote_char == '`':
+        return text.replace('${', '\\${')
+    return text.replace('\n', '\\n').replace('\r', '\\r')
+
+def _placeholders(sql):
+    placeholders = []
+    i = sql.find('${')
+    while i >= 0:
+        end = _scan_expression(sql, i + 2)
+        placeholders.append((i, end))
+        i = sql.find('${', end)
+    return placeholders
+
+# Function to extract the SQL passed to evaluateQuery/safeEvaluateQuery, either inline or through a variable
+def extract_queries(component_code):
+    queries = []
+    seen = set()
+    for match in QUERY_CALL_PATTERN.finditer(component_code):
+        position = match.end()
+        if position >= len(component_code):
+            continue
+        if component_code[position] in '\'"`':
+            start, end = _literal_at(component_code, position)
+        else:
+            identifier = re.match(r'[A-Za-z_$][\w$]*', component_code[position:])
+            if not identifier:
+                continue
+            # Use the closest preceding assignment of the variable to a literal
+            assignments = list(re.finditer(rf'\b(?:const|let|var)\s+{re.escape(identifier.group(0))}\s*=\s*([\'"`])',
+                                           component_code[:position]))
+            if not assignments:
+                continue
+            start, end = _literal_at(component_code, assignments[-1].start(1))
+        if start in seen:
+            continue
+        seen.add(start)
+        sql = component_code[start:end]
+        line = component_code.count('\n', 0, start) + 1
+        queries.append(EmbeddedQuery(sql, start, end, line, [sql[s + 2:e - 1] for s, e in _placeholders(sql)]))
+    return queries
+
+def _quoted_value(expression):
+    name = expression.lower()
+    if re.search(r'date|time|day|start|end', name):
+        return '2000-01-01'
+    if 'year' in name:
+        return '2000'
+    return '0'
+
+# Function to turn the raw text of a literal into SQL, replacing ${...} placeholders with representative
+# values. Returns one candidate per way of filling unquoted placeholders (a value, or nothing for optional
+# SQL fragments); None if a placeholder is used as a table name, since such queries cannot be checked
+def substitution_candidates(sql):
+    sql = decode_literal(sql)
+    placeholders = _placeholders(sql)
+    if not placeholders:
+        return [sql]
+    for start, _ in placeholders:
+        if re.search(r'\b(FROM|JOIN)\s*$', sql[:start], re.IGNORECASE):
+            return None
+
+    candidates = []
+    for unquoted_value in ('1', ''):
+        parts = []
+        previous_end = 0
+        for start, end in placeholders:
+            parts.append(sql[previous_end:start])
+            expression = sql[start + 2:end - 1]
+            is_quoted = sql[start - 1:start] == "'" and sql[end:end + 1] == "'"
+            parts.append(_quoted_value(expression) if is_quoted else unquoted_value)
+            previous_end = end
+        parts.append(sql[previous_end:])
+        candidates.append(''.join(parts))
+    return candidates
+
+# Function to return the text of the physical plan of a query
+def explain_plan(cursor, sql):
+    return "\n".join(row[1] for row in cursor.execute(f"EXPLAIN {sql}").fetchall())
+
+# Function to return the estimated cardinalities of a plan, from the top of the plan down
+def plan_estimates(plan):
+    return [int(ec or rows) for ec, rows in ESTIMATE_PATTERN.findall(plan)]
+
+# Function to check one query with EXPLAIN on its own cursor, returns the error message or None
+def explain_query(pool, query):
+    candidates = substitution_candidates(query.sql)
+    if candidates is None:
+        return None
+    with pool.cursor() as cursor:
+        first_error = None
+        for candidate in candidates:
+            try:
+                cursor.execute(f"EXPLAIN {candidate.strip().rstrip(';')}")
+                return None
+            except QUERY_ERRORS as e:
+                first_error = first_error or str(e)
+            except duckdb.Error:
+                return None
+        return first_error
+
+# Function to validate all queries of a component in parallel, returns a list of errors
+def validate_component(pool, component_code):
+    queries = extract_queries(component_code)
+    if not queries:
+        return []
+    with ThreadPoolExecutor(max_workers=SQL_VALIDATION_WORKERS) as executor:
+        messages = list(executor.map(lambda query: explain_query(pool, query), queries))
+    return [{"line": query.line, "sql": query.sql.strip(), "message": message}
+            for query, message in zip(queries, messages) if message]
+
+def format_query_errors(errors):
+    lines = ["Error validating the SQL queries of the app:"]
+    for error in errors:
+        lines.append(f"MyApp.jsx:{error['line']}: {error['message']}")
+        lines.append(f"Query: {error['sql']}")
+    return "\n".join(lines)
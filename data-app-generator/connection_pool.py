@@ -0,0 +1,64 @@
+import os
+import queue
+import threading
+import time
+from contextlib import contextmanager
+
+DUCKDB_POOL_SIZE = int(os.getenv('DUCKDB_POOL_SIZE', '8'))
+DUCKDB_POOL_TIMEOUT = float(os.getenv('DUCKDB_POOL_TIMEOUT', '30'))
+
+# Pool of cursors on one DuckDB connection. Each cursor is an independent connection to the same
+# database instance, so sessions and jobs can run catalog queries concurrently without sharing state.
+class CursorPool:
+    def __init__(self, conn, size=DUCKDB_POOL_SIZE, timeout=DUCKDB_POOL_TIMEOUT):
+        self.conn = conn
+        self.size = size
+        self.timeout = timeout
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._created = 0
+        self._in_use = 0
+        self._stats = {"checkouts": 0, "waits": 0, "timeouts": 0, "total_wait_s": 0.0, "max_wait_s": 0.0, "peak_in_use": 0}
+
+    def _acquire(self):
+        try:
+            return self._idle.get_nowait(), False
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._created < self.size:
+                self._created += 1
+                return self.conn.cursor(), False
+        try:
+            return self._idle.get(timeout=self.timeout), True
+        except queue.Empty:
+            with self._lock:
+                self._stats["timeouts"] += 1
+            raise TimeoutError(f"No DuckDB cursor available after {self.timeout}s (pool size {self.size})")
+
+    # Function to check out a cursor for the duration of a with block
+    @contextmanager
+    def cursor(self):
+        start = time.monotonic()
+        cursor, waited = self._acquire()
+        wait_s = time.monotonic() - start
+        with self._lock:
+            self._in_use += 1
+            self._stats["checkouts"] += 1
+            self._stats["waits"] += waited
+            self._stats["total_wait_s"] += wait_s
+            self._stats["max_wait_s"] = max(self._stats["max_wait_s"], wait_s)
+            self._stats["peak_in_use"] = max(self._stats["peak_in_use"], self._in_use)
+        try:
+            yield cursor
+        finally:
+            with self._lock:
+                self._in_use -= 1
+            self._idle.put(cursor)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats.update(size=self.size, created=self._created, in_use=self._in_use)
+        stats["avg_wait_s"] = stats["total_wait_s"] / stats["checkouts"] if stats["checkouts"] else 0.0
+        return stats
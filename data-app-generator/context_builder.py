@@ -0,0 +1,72 @@
+import os
+import re
+
+from schema_index import estimate_tokens
+
+# Token budget for the verbatim part of the conversation history
+CONTEXT_HISTORY_BUDGET = int(os.getenv('CONTEXT_HISTORY_BUDGET', '8000'))
+# Maximum number of latest messages kept verbatim
+CONTEXT_RECENT_MESSAGES = int(os.getenv('CONTEXT_RECENT_MESSAGES', '6'))
+# Token budget for the rolling summary of older turns, the oldest lines are dropped first
+CONTEXT_SUMMARY_BUDGET = int(os.getenv('CONTEXT_SUMMARY_BUDGET', '1500'))
+
+SUMMARY_LINE_LENGTH = 200
+COMPONENT_PLACEHOLDER = "<component>[omitted, the current version of the app is included in the latest message]</component>"
+
+# Function to drop component source from a history message, the current app is always sent with the prompt
+def strip_components(content, placeholder=COMPONENT_PLACEHOLDER):
+    return re.sub(r'<component>.*?(</component>|<component>|$)', placeholder, content, flags=re.DOTALL)
+
+def _summary_line(message):
+    text = " ".join(strip_components(message["content"], "[component]").split())
+    if len(text) > SUMMARY_LINE_LENGTH:
+        text = text[:SUMMARY_LINE_LENGTH - 3] + "..."
+    speaker = "User" if message["role"] == "user" else "Assistant"
+    return f"- {speaker}: {text}"
+
+def _trim_summary(lines):
+    while len(lines) > 1 and estimate_tokens("\n".join(lines)) > CONTEXT_SUMMARY_BUDGET:
+        lines = lines[1:]
+    return lines
+
+# Function to assemble the messages of a turn within the token budget. The latest messages are kept
+# verbatim, older ones are folded into a rolling summary that is carried over in state between turns.
+# Returns the messages, per-part token counts and the updated state.
+def build_messages(system_prompt, history, prompt, state=None):
+    state = state or {"summary_lines": [], "folded": 0}
+    history = [{"role": m["role"], "content": strip_components(m["content"])} for m in history]
+    folded = min(state["folded"], len(history))
+
+    # Walk back from the newest message while the budget allows, without unfolding folded messages
+    keep_from = len(history)
+    history_tokens = 0
+    while keep_from > folded and len(history) - keep_from < CONTEXT_RECENT_MESSAGES:
+        message_tokens = estimate_tokens(history[keep_from - 1]["content"])
+        if history_tokens + message_tokens > CONTEXT_HISTORY_BUDGET:
+            break
+        history_tokens += message_tokens
+        keep_from -= 1
+    # Start the verbatim part with a user message
+    while keep_from < len(history) and history[keep_from]["role"] != "user":
+        history_tokens -= estimate_tokens(history[keep_from]["content"])
+        keep_from += 1
+
+    summary_lines = _trim_summary(state["summary_lines"] + [_summary_line(m) for m in history[folded:keep_from]])
+    state = {"summary_lines": summary_lines, "folded": keep_from}
+
+    system_content = system_prompt
+    if summary_lines:
+        system_content += "\n<conversation_summary>\nEarlier in this conversation:\n" + "\n".join(summary_lines) + "\n</conversation_summary>\n"
+    messages = [{"role": "system", "content": system_content}]
+    messages += history[keep_from:]
+    messages.append({"role": "user", "content": prompt})
+
+    token_counts = {
+        "system": estimate_tokens(system_prompt),
+        "summary": estimate_tokens(system_content) - estimate_tokens(system_prompt),
+        "history": history_tokens,
+        "prompt": estimate_tokens(prompt),
+        "folded_messages": keep_from,
+    }
+    token_counts["total"] = token_counts["system"] + token_counts["summary"] + token_counts["history"] + token_counts["prompt"]
+    return messages, token_counts, state
@@ -0,0 +1,180 @@
+import atexit
+import collections
+import os
+import signal
+import socket
+import subprocess
+import threading
+import time
+
+DEV_SERVER_LOG_LINES = int(os.getenv('DEV_SERVER_LOG_LINES', '500'))
+DEV_SERVER_MAX_RESTARTS = int(os.getenv('DEV_SERVER_MAX_RESTARTS', '5'))
+# Dev servers running at the same time, the least recently used one is stopped to make room for another
+DEV_SERVER_MAX = int(os.getenv('DEV_SERVER_MAX', '8'))
+# Restarts are counted within this window, a server that stays up longer starts with a clean slate
+RESTART_WINDOW = 300
+RESTART_BACKOFF_MAX = 30
+
+# Function to find a free port for a dev server
+def find_free_port():
+    with socket.socket() as s:
+        s.bind(('localhost', 0))
+        return s.getsockname()[1]
+
+# Function to check whether something accepts connections on a local port
+def is_port_open(port, timeout=0.5):
+    try:
+        with socket.create_connection(('localhost', port), timeout=timeout):
+            return True
+    except OSError:
+        return False
+
+# Supervisor of the npm run dev process of one app directory. Its output is drained by a
+# background thread into a bounded ring buffer, so the pipe never fills up, and the process is
+# restarted with a backoff when it exits unexpectedly.
+class DevServer:
+    def __init__(self, app_dir, port=None, log_lines=DEV_SERVER_LOG_LINES):
+        self.app_dir = app_dir
+        self.port = port or find_free_port()
+        self.process = None
+        self.log = collections.deque(maxlen=log_lines)
+        self.restarts = []
+        self.last_exit_code = None
+        self.gave_up = False
+        self.last_used = time.monotonic()
+        self._stopped = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def start(self):
+        with self._lock:
+            if self.gave_up or (self._thread is not None and self._thread.is_alive()):
+                return
+            self._stopped.clear()
+            self._thread = threading.Thread(target=self._supervise, daemon=True, name=f"dev-server-{self.port}")
+            self._thread.start()
+
+    def _spawn(self):
+        if is_port_open(self.port):
+            # The port was taken while the server was down, --strictPort would make Vite exit
+            self.port = find_free_port()
+        self.log.append(f"$ npm run dev -- --port {self.port} --strictPort")
+        # A new session makes npm and the Vite process it spawns one process group, stopped together
+        return subprocess.Popen(['npm', 'run', 'dev', '--', '--port', str(self.port), '--strictPort'],
+                                cwd=self.app_dir, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE,
+                                stderr=subprocess.STDOUT, text=True, bufsize=1, start_new_session=True)
+
+    def _supervise(self):
+        while not self._stopped.is_set():
+            try:
+                process = self._spawn()
+            except OSError as e:
+                self.log.append(f"Could not start the dev server: {e}")
+                process = None
+            if process is not None:
+                with self._lock:
+                    self.process = process
+                if self._stopped.is_set():
+                    # stop() was called while the process was being spawned
+                    os.killpg(process.pid, signal.SIGTERM)
+                for line in process.stdout:
+                    self.log.append(line.rstrip())
+                self.last_exit_code = process.wait()
+                if self._stopped.is_set():
+                    break
+                self.log.append(f"Dev server exited with code {self.last_exit_code}")
+
+            now = time.monotonic()
+            self.restarts = [t for t in self.restarts if now - t < RESTART_WINDOW] + [now]
+            if len(self.restarts) > DEV_SERVER_MAX_RESTARTS:
+                self.log.append(f"Dev server crashed {len(self.restarts)} times in {RESTART_WINDOW}s, giving up")
+                self.gave_up = True
+                break
+            backoff = min(RESTART_BACKOFF_MAX, 2 ** (len(self.restarts) - 1))
+            self.log.append(f"Restarting dev server in {backoff}s")
+            self._stopped.wait(backoff)
+
+    def stop(self, timeout=5):
+        self._stopped.set()
+        with self._lock:
+            process = self.process
+        if process is not None and process.poll() is None:
+            try:
+                os.killpg(process.pid, signal.SIGTERM)
+                process.wait(timeout=timeout)
+            except subprocess.TimeoutExpired:
+                os.killpg(process.pid, signal.SIGKILL)
+            except OSError:
+                pass
+        if self._thread is not None:
+            self._thread.join(timeout=timeout)
+
+    # Function to restart the server on request, also after the supervisor gave up
+    def restart(self):
+        self.stop()
+        self.gave_up = False
+        self.restarts = []
+        self.start()
+
+    @property
+    def is_running(self):
+        return self.process is not None and self.process.poll() is None
+
+    # The server is healthy once it is running and accepts connections on its port
+    def is_healthy(self):
+        return self.is_running and is_port_open(self.port)
+
+    @property
+    def url(self):
+        return f'http://localhost:{self.port}'
+
+    def log_lines(self):
+        return list(self.log)
+
+    def status(self):
+        return {
+            "port": self.port,
+            "pid": self.process.pid if self.process is not None else None,
+            "running": self.is_running,
+            "healthy": self.is_healthy(),
+            "recent_restarts": len(self.restarts),
+            "last_exit_code": self.last_exit_code,
+            "gave_up": self.gave_up,
+        }
+
+_servers = {}
+_servers_lock = threading.Lock()
+
+# Function to return the running dev server of an app directory, one per workspace. The server outlives
+# reruns, and a reloaded page finds it again through its workspace. At most DEV_SERVER_MAX servers run,
+# starting another one stops the least recently used, which starts again when its workspace is used.
+def get_dev_server(app_dir, max_servers=DEV_SERVER_MAX):
+    app_dir = os.path.normpath(app_dir)
+    evicted = []
+    with _servers_lock:
+        if app_dir not in _servers:
+            while _servers and len(_servers) >= max_servers:
+                least_recently_used = min(_servers, key=lambda key: _servers[key].last_used)
+                evicted.append(_servers.pop(least_recently_used))
+            _servers[app_dir] = DevServer(app_dir)
+        server = _servers[app_dir]
+        server.last_used = time.monotonic()
+    for evicted_server in evicted:
+        print(f"Stopping the dev server of {evicted_server.app_dir}, more than {max_servers} are running")
+        evicted_server.stop()
+    server.start()
+    return server
+
+def stop_dev_server(app_dir):
+    with _servers_lock:
+        server = _servers.pop(os.path.normpath(app_dir), None)
+    if server is not None:
+        server.stop()
+
+@atexit.register
+def stop_all():
+    with _servers_lock:
+        servers = list(_servers.values())
+        _servers.clear()
+    for server in servers:
+        server.stop()
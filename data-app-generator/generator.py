@@ -1,11 +1,15 @@
 import re
 
+COMPONENT_OPEN_TAG = '<component>'
+COMPONENT_CLOSE_TAG = '</component>'
+component_pattern = re.compile(r'<component>(.*?)</component>', re.DOTALL)
+summary_pattern = re.compile(r'<summary>(.*?)</summary>', re.DOTALL)
+
 def extract_component(input_text):
     # Remove text wrapped in <thinking> tags
     clean_text = re.sub(r'<thinking>.*?</thinking>', '', input_text, flags=re.DOTALL).strip()
 
     # Extract text and attributes within <components> tags
-    component_pattern = re.compile(r'<component>(.*?)</component>', re.DOTALL)
     component_match = component_pattern.search(input_text)
 
     if component_match:
@@ -13,7 +17,44 @@ def extract_component(input_text):
     else:
         component_code = ""
 
-    return clean_text, component_code
+    # Extract the summary of the changes, searched after the component so code containing "<summary>" is ignored
+    summary_match = summary_pattern.search(input_text, component_match.end() if component_match else 0)
+    summary = summary_match.group(1).strip() if summary_match else ""
+
+    return clean_text, component_code, summary
+
+# Incremental parser for streamed responses: feed chunks as they arrive, the component code
+# becomes available as soon as the closing </component> tag has been received
+class ComponentStreamParser:
+    def __init__(self):
+        self.text = ""
+        self.component_code = None
+        self._open_index = -1
+        self._scan_from = 0
+
+    def feed(self, chunk):
+        self.text += chunk
+        if self.component_code is not None:
+            return self.component_code
+
+        # Only scan the new part of the text, overlapping by a tag length for tags split across chunks
+        if self._open_index < 0:
+            self._open_index = self.text.find(COMPONENT_OPEN_TAG, self._scan_from)
+            if self._open_index < 0:
+                self._scan_from = max(0, len(self.text) - len(COMPONENT_OPEN_TAG))
+                return None
+            self._scan_from = self._open_index + len(COMPONENT_OPEN_TAG)
+
+        close_index = self.text.find(COMPONENT_CLOSE_TAG, self._scan_from)
+        if close_index < 0:
+            self._scan_from = max(self._open_index + len(COMPONENT_OPEN_TAG), len(self.text) - len(COMPONENT_CLOSE_TAG))
+            return None
+        self.component_code = self.text[self._open_index + len(COMPONENT_OPEN_TAG):close_index].strip()
+        return self.component_code
+
+    @property
+    def is_in_component(self):
+        return self._open_index >= 0 and self.component_code is None
 
 generator_prompt = """
 <component_info>
@@ -32,18 +73,21 @@ Generate only one component per message. Prefer in-line content and keep things
   - Determine if it's a new component or an update to an existing one (reusing the prior identifier for updates).
 2. Wrapping Content:
   - Wrap the content in opening and closing `<component>` tags.
+  - End every response with a one sentence summary of the changes you have done, addressed to the user and wrapped in `<summary>` tags. If you did not create or update a component, summarize your answer instead.
 3. Follow Coding Guidelines:
 	- Display React elements, functional components, or component classes.
 	- No required props or provide default values for props.
 	- Use Tailwind classes for styling; avoid arbitrary values.
 	- Import Base React and hooks as needed.
-	- Import and use lucide-react library.
-	- Import and use the recharts charting library.
+	- Import and use lucide-react library. Import icons by name, e.g. `import { TrendingUp } from 'lucide-react'`, never the whole library (`import * as Icons from 'lucide-react'`), so unused icons are left out of the bundle.
+	- Import and use the recharts charting library. Load charts lazily so recharts does not delay the first render: `const SalesChart = lazy(() => import('recharts').then(({ ResponsiveContainer, BarChart, Bar, XAxis, YAxis, Tooltip }) => ({ default: ({ data }) => (<ResponsiveContainer width="100%" height={300}><BarChart data={data}><XAxis dataKey="region" /><YAxis /><Tooltip /><Bar dataKey="total" /></BarChart></ResponsiveContainer>) })));` and render it inside `<Suspense fallback={...}>`.
 	- Use prebuilt components from `shadcn/ui` library and assist users with installation if necessary.
 	- The following shadcn libraries are available alert, calendar, card, chart, checkbox, form, input, label, select, slider, switch, table, tabs, textarea, toggle, tooltip
 	- Do not use other libraries.
 	- Use placeholder images with specified width and height.
 	- Write SQL that is compatible with DuckDB and MotherDuck syntax.
+	- Query MotherDuck only through the shared query layer in './mdQuery': the `useQuery(sql)` hook returns `{ rows, loading, error }` and re-runs when the query text changes, `runQuery(sql)` returns a promise of the result for event handlers. Both share one connection, send identical queries once and cache results. Do not create your own connection or call `evaluateQuery` directly.
+	- Aggregate, filter and sort in SQL (GROUP BY, WHERE, ORDER BY ... LIMIT) rather than in JavaScript, so a query returns only the rows the UI shows. Queries returning more than a few thousand rows are capped automatically.
 4. Follow Design Principles:
     - Ensure that your UI and charts are clear and easily understandable. Avoid clutter and make information easy to read at a glance.
     - Maintain a consistent style, including colors, fonts, and graph types, throughout your application to create a cohesive user experience.
@@ -59,7 +103,7 @@ Generate only one component per message. Prefer in-line content and keep things
 7. Defensive Error Handling:
   - Handle Connection and Query execution errors against MotherDuck gracefully and surface useful error messages to the user in the UI, not in the console.
   - Catch other possible errors (e.g., data conversions) and surface useful error messages to the user in the UI, not in the console.
-8. Proper Result Fetching: Use rows = result.data.toRows(). Don't use result.data.toArray, this function does not exist.
+8. Proper Result Fetching: `useQuery` already returns the rows. For `runQuery`, use rows = result.data.toRows(). Don't use result.data.toArray, this function does not exist.
 9. ALWAYS!! convert numeric values and date values coming from the database to JavaScript types when using them!
    <example>
     rows = result.data.toRows()
@@ -92,64 +136,37 @@ Here are some example conversations:
     </user_query>
 
     <assistant_response>
-      Absolutely! Here's a React component that connects to MotherDuck, and executes an example query and shows the result in a text area:
+      Absolutely! Here's a React component that executes an example query on MotherDuck and shows the result in a text area:
 
-      <thinking>The user wants me to create a React component that connects to MotherDuck, executes a query, and fetch the results to display them in a simple text area. 
+      <thinking>The user wants me to create a React component that executes a query on MotherDuck through the shared query layer, and fetch the results to display them in a simple text area. 
       The request is clear so I can proceed with generating the component. Within the coding guidelines, I can use simple HTML component to generate the text area, as requested by the user. 
       I will adhere to the component instructions and convert numeric and date values to JavaScript objects.
       Also I will add some error handling to surface possible error messages from the query execution to the user</thinking>
 
       <component>
-        import React, { useState, useEffect } from 'react';
-        import { useMDConnection } from './useMDConnection';
+        import React from 'react';
+        import { useQuery } from './mdQuery';
         import { Alert, AlertTitle, AlertDescription } from '@/components/ui/alert';
         
         const ExampleApp = () => {
-          const { connection, connect } = useMDConnection();
-          const [displayData, setDisplayData] = useState(null);
-          const [error, setError] = useState(null);
-        
-          useEffect(() => {
-            connect();
-          }, [connect]);
-        
-          useEffect(() => {
-            const fetchData = async () => {
-              if (connection) {
-                try {
-                  const result = await connection.evaluateQuery("SELECT my_int, my_date FROM (SELECT 1 as my_int, strptime('2024-02-01', '%Y-%m-%d') as my_date);");
-                  const rows = result.data.toRows();
-                  
-                  // Process each row
-                  const processedRow = {
-                    my_int: Number(row.my_int),
-                    my_date: new Date(row.my_date)
-                  };
-        
-                  setDisplayData(processedRow);
-                  setError(null); // Clear any previous errors
-                } catch (error) {
-                  setError(`Error fetching data: ${error.message}`);
-                  setDisplayData(null);
-                }
-              }
-            };
-        
-            fetchData();
-          }, [connection]);
+          const { rows, loading, error } = useQuery("SELECT my_int, my_date FROM (SELECT 1 as my_int, strptime('2024-02-01', '%Y-%m-%d') as my_date);");
         
-          if (!connection) return <div>Loading...</div>;
+          if (loading) return <div>Fetching data...</div>;
         
           if (error) {
             return (
                 <Alert variant="destructive">
                   <AlertTitle>Error</AlertTitle>
-                  <AlertDescription>{error}</AlertDescription>
+                  <AlertDescription>{`Error fetching data: ${error.message}`}</AlertDescription>
                 </Alert>
             );
           }
         
-          if (!displayData) return <div>Fetching data...</div>;
+          // Convert the values coming from the database to JavaScript types
+          const displayData = {
+            my_int: Number(rows[0].my_int),
+            my_date: new Date(rows[0].my_date)
+          };
         
           return (
               <div>
@@ -162,7 +179,7 @@ Here are some example conversations:
         export default ExampleApp;
       </component>
 
-      ...
+      <summary>I created a component that runs an example query against MotherDuck and shows the numeric and date values.</summary>
 
     </assistant_response>
   </example>
@@ -182,8 +199,8 @@ Here are some example conversations:
       I will revise the existing code and print a complete version of the updates component</thinking>
 
       <component>
-        import React, { useState, useEffect } from 'react';
-        import { useMDConnection } from './useMDConnection';
+        import React from 'react';
+        import { useQuery } from './mdQuery';
         import { Alert, AlertTitle, AlertDescription } from '@/components/ui/alert';
         import {
           Table,
@@ -196,51 +213,24 @@ Here are some example conversations:
         } from "@/components/ui/table"
         
         const ExampleApp = () => {
-          const { connection, connect } = useMDConnection();
-          const [displayData, setDisplayData] = useState(null);
-          const [error, setError] = useState(null);
+          const { rows, loading, error } = useQuery("SELECT my_int, my_date FROM (SELECT 1 as my_int, strptime('2024-02-01', '%Y-%m-%d') as my_date);");
         
-          useEffect(() => {
-            connect();
-          }, [connect]);
-        
-          useEffect(() => {
-            const fetchData = async () => {
-              if (connection) {
-                try {
-                  const result = await connection.evaluateQuery("SELECT my_int, my_date FROM (SELECT 1 as my_int, strptime('2024-02-01', '%Y-%m-%d') as my_date);");
-                  const rows = result.data.toRows();
-                  
-                  // Process each row
-                  const processedRow = {
-                    my_int: Number(row.my_int),
-                    my_date: new Date(row.my_date)
-                  };
-        
-                  setDisplayData(processedRows);
-                  setError(null); // Clear any previous errors
-                } catch (error) {
-                  setError(`Error fetching data: ${error.message}`);
-                  setDisplayData(null);
-                }
-              }
-            };
-        
-            fetchData();
-          }, [connection]);
-        
-          if (!connection) return <div>Loading...</div>;
+          if (loading) return <div>Fetching data...</div>;
         
           if (error) {
             return (
               <Alert variant="destructive">
                 <AlertTitle>Error</AlertTitle>
-                <AlertDescription>{error}</AlertDescription>
+                <AlertDescription>{`Error fetching data: ${error.message}`}</AlertDescription>
               </Alert>
             );
           }
         
-          if (!displayData) return <div>Fetching data...</div>;
+          // Convert the values coming from the database to JavaScript types
+          const displayData = rows.map((row) => ({
+            my_int: Number(row.my_int),
+            my_date: new Date(row.my_date)
+          }));
         
           return (
             <Table>
@@ -266,7 +256,7 @@ Here are some example conversations:
         export default ExampleApp;
       </component>
 
-      ...
+      <summary>I replaced the text area with a shadcn table that shows the query results.</summary>
 
     </assistant_response>
   </example>
@@ -366,8 +356,15 @@ cursor_prompt = """### Rules for Generating MotherDuck WASM Data App
 - Use error boundaries for graceful error handling in UI components.
 - Use suspense for data fetching when possible.
 
+#### Querying MotherDuck
+- Query MotherDuck only through the shared query layer in `src/components/mdQuery.js`; never create another connection or call `evaluateQuery` directly.
+- In components, use the `useQuery(sql, {{ ttl, enabled }})` hook. It returns `{{ rows, loading, error }}` and re-runs when the query text changes.
+- In event handlers, use `runQuery(sql, {{ ttl }})`. It returns a promise of the result; read it with `result.data.toRows()`.
+- Identical queries running at the same time are sent once, and results are cached for `ttl` milliseconds (default 60s). Pass `{{ ttl: 0 }}` for data that must always be fresh, and call `clearQueryCache()` after writes.
+
 #### Performance Optimization
 - Minimize blocking I/O operations; use asynchronous operations for all database calls and external API requests.
+- Keep the initial bundle small: load recharts charts with `React.lazy` and `Suspense`, import lucide-react icons by name, and only import the shadcn components the app uses. The generator records the size of every build's chunks and warns when the app is over its bundle budget.
 - Implement caching for static and frequently accessed data using tools like local storage or memoization.
 - Optimize data serialization and deserialization with efficient patterns.
 - Use lazy loading techniques for large datasets or substantial API responses.
@@ -0,0 +1,124 @@
+import itertools
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from cancellation import JobCancelled
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+# A unit of background work with named stages. The worker reports progress through the job,
+# the UI polls job.snapshot() and can cancel the job at any time.
+class Job:
+    _ids = itertools.count(1)
+
+    def __init__(self, stages):
+        self.id = next(self._ids)
+        self.stages = list(stages)
+        self.status = QUEUED
+        self.stage = None
+        self.message = ""
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        # time.monotonic() by which the work should be done, enforced by the work itself
+        self.deadline = None
+        self.stage_timings = {}
+        self._stage_started_at = None
+        self._cancel_event = threading.Event()
+        self._done_event = threading.Event()
+        self._lock = threading.Lock()
+
+    @property
+    def is_cancelled(self):
+        return self._cancel_event.is_set()
+
+    @property
+    def is_done(self):
+        return self._done_event.is_set()
+
+    def cancel(self):
+        self._cancel_event.set()
+
+    def set_deadline(self, seconds):
+        self.deadline = time.monotonic() + seconds
+
+    def wait(self, timeout=None):
+        return self._done_event.wait(timeout)
+
+    def check_cancelled(self):
+        if self.is_cancelled:
+            raise JobCancelled()
+
+    # Function to move the job to the next stage, also a cancellation point
+    def set_stage(self, stage, message=""):
+        self.check_cancelled()
+        now = time.monotonic()
+        with self._lock:
+            if self.stage is not None:
+                self.stage_timings[self.stage] = self.stage_timings.get(self.stage, 0) + now - self._stage_started_at
+            self.stage = stage
+            self.message = message
+            self._stage_started_at = now
+
+    def update(self, message):
+        with self._lock:
+            self.message = message
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "id": self.id,
+                "status": self.status,
+                "stage": self.stage,
+                "stage_index": self.stages.index(self.stage) if self.stage in self.stages else -1,
+                "stages": self.stages,
+                "message": self.message,
+                "elapsed": (self.finished_at or time.time()) - (self.started_at or self.created_at),
+            }
+
+    def _run(self, fn, previous_job):
+        # Jobs of one session run one after another, a superseded job stops at its next cancellation point
+        if previous_job is not None:
+            previous_job.wait()
+        self.started_at = time.time()
+        self.status = RUNNING
+        try:
+            self.check_cancelled()
+            self.result = fn(self)
+            self.status = SUCCEEDED
+        except JobCancelled:
+            self.status = CANCELLED
+        except Exception as e:
+            self.error = e
+            self.status = FAILED
+        finally:
+            if self.stage is not None:
+                self.stage_timings[self.stage] = self.stage_timings.get(self.stage, 0) + time.monotonic() - self._stage_started_at
+            self.finished_at = time.time()
+            self._done_event.set()
+
+# Runs jobs on a shared thread pool. Submitting a job for a session supersedes the session's previous job.
+class JobExecutor:
+    def __init__(self, max_workers=4):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="job")
+        self._latest_jobs = {}
+        self._lock = threading.Lock()
+
+    def submit(self, session_id, fn, stages):
+        job = Job(stages)
+        with self._lock:
+            previous_job = self._latest_jobs.get(session_id)
+            if previous_job is not None and not previous_job.is_done:
+                previous_job.cancel()
+            else:
+                previous_job = None
+            self._latest_jobs[session_id] = job
+        self._executor.submit(job._run, fn, previous_job)
+        return job
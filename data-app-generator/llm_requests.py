@@ -0,0 +1,178 @@
+import math
+import os
+import queue
+import threading
+import time
+from collections import deque
+
+LLM_HEDGING_ENABLED = os.getenv('LLM_HEDGING', '1') == '1'
+# A request without a first token after this percentile of the observed times to first token is hedged
+LLM_HEDGE_PERCENTILE = float(os.getenv('LLM_HEDGE_PERCENTILE', '90'))
+# Hedge delay until enough requests were observed, and lower bound of the delay, in seconds
+LLM_HEDGE_DEFAULT_DELAY = float(os.getenv('LLM_HEDGE_DEFAULT_DELAY', '20'))
+LLM_HEDGE_MIN_DELAY = float(os.getenv('LLM_HEDGE_MIN_DELAY', '0.25'))
+# Upper bound of the delay as a multiple of the median time to first token. When more requests than the
+# percentile leaves out are slow, the percentile is one of the slow requests and would never hedge them.
+LLM_HEDGE_MEDIAN_FACTOR = float(os.getenv('LLM_HEDGE_MEDIAN_FACTOR', '3'))
+# Model of the hedged duplicate, the model of the request if empty
+LLM_FALLBACK_MODEL = os.getenv('LLM_FALLBACK_MODEL', '')
+MIN_SAMPLES = 5
+WINDOW_SIZE = 100
+# Seconds between checks of the cancel event while no chunk arrives
+CANCEL_POLL_INTERVAL = 0.1
+
+class DeadlineExceeded(TimeoutError):
+    pass
+
+# Times to first token of the latest requests of one kind, e.g. generations of one model
+class LatencyTracker:
+    def __init__(self, window_size=WINDOW_SIZE):
+        self._samples = deque(maxlen=window_size)
+        self._lock = threading.Lock()
+
+    def record(self, seconds):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, percentile):
+        with self._lock:
+            samples = sorted(self._samples)
+        if len(samples) < MIN_SAMPLES:
+            return None
+        return samples[max(0, math.ceil(percentile / 100 * len(samples)) - 1)]
+
+    # Function to return the seconds to wait for a first token before hedging
+    def hedge_delay(self):
+        observed = self.percentile(LLM_HEDGE_PERCENTILE)
+        if observed is None:
+            return LLM_HEDGE_DEFAULT_DELAY
+        return max(LLM_HEDGE_MIN_DELAY, min(observed, LLM_HEDGE_MEDIAN_FACTOR * self.percentile(50)))
+
+_trackers = {}
+_trackers_lock = threading.Lock()
+
+def get_tracker(model, purpose):
+    with _trackers_lock:
+        return _trackers.setdefault((model, purpose), LatencyTracker())
+
+# One streaming request, read on a thread of its own into the queue shared by all attempts of a call
+class _Attempt:
+    def __init__(self, name, model, create, events):
+        self.name = name
+        self.model = model
+        self.started = time.perf_counter()
+        self.stream = None
+        self.closed = False
+        self._create = create
+        self._events = events
+        threading.Thread(target=self._read, daemon=True, name=f"llm-{name}").start()
+
+    def _read(self):
+        try:
+            self.stream = self._create(self.model)
+            if self.closed:
+                self.stream.close()
+                return
+            for chunk in self.stream:
+                if self.closed:
+                    return
+                self._events.put((self, "chunk", chunk))
+            self._events.put((self, "end", None))
+        except Exception as e:
+            if not self.closed:
+                self._events.put((self, "error", e))
+
+    def close(self):
+        self.closed = True
+        if self.stream is not None:
+            try:
+                self.stream.close()
+            except Exception:
+                pass
+
+def _has_content(chunk):
+    return bool(chunk.choices and chunk.choices[0].delta.content)
+
+# Function to stream the chunks of a chat completion, hedged against slow first tokens. create(model)
+# opens the stream. If no token arrived after the percentile of recent times to first token, a duplicate
+# request goes out, to LLM_FALLBACK_MODEL if set, and the first attempt to produce a token is streamed.
+# A failing attempt is hedged at once. Raises DeadlineExceeded once time.monotonic() passes deadline, and
+# ends the stream early once cancel_event is set. Decisions are appended to decisions as
+# {"at_ms", "decision", ...} for the caller's telemetry.
+def hedged_stream(create, model, purpose="generate", deadline=None, decisions=None, cancel_event=None):
+    decisions = decisions if decisions is not None else []
+    tracker = get_tracker(model, purpose)
+    hedge_delay = tracker.hedge_delay() if LLM_HEDGING_ENABLED else None
+    started = time.perf_counter()
+    events = queue.Queue()
+    attempts = [_Attempt("primary", model, create, events)]
+    winner = None
+
+    def log(decision, **details):
+        decisions.append({"at_ms": round((time.perf_counter() - started) * 1000, 1), "decision": decision, **details})
+
+    def hedge(reason):
+        hedge_model = LLM_FALLBACK_MODEL or model
+        log("hedge", reason=reason, model=hedge_model)
+        print(f"LLM {purpose} request hedged to {hedge_model}: {reason}")
+        attempts.append(_Attempt("hedge", hedge_model, create, events))
+
+    try:
+        while True:
+            timeouts = []
+            if deadline is not None:
+                timeouts.append(deadline - time.monotonic())
+            can_hedge = winner is None and hedge_delay is not None and len(attempts) == 1
+            if can_hedge:
+                timeouts.append(started + hedge_delay - time.perf_counter())
+            if cancel_event is not None:
+                timeouts.append(CANCEL_POLL_INTERVAL)
+            try:
+                attempt, kind, payload = events.get(timeout=max(0, min(timeouts)) if timeouts else None)
+            except queue.Empty:
+                if deadline is not None and time.monotonic() >= deadline:
+                    log("deadline", waited_ms=round((time.perf_counter() - started) * 1000, 1))
+                    raise DeadlineExceeded(f"The turn's deadline passed while waiting for the {purpose} request")
+                if cancel_event is not None and cancel_event.is_set():
+                    log("cancelled")
+                    return
+                if can_hedge and time.perf_counter() >= started + hedge_delay:
+                    hedge(f"no first token after {hedge_delay:.1f}s (p{LLM_HEDGE_PERCENTILE:g} of recent requests)")
+                continue
+
+            if winner is not None and attempt is not winner:
+                continue
+            if kind == "error":
+                log("error", attempt=attempt.name, error=str(payload) or type(payload).__name__)
+                if winner is not None:
+                    raise payload
+                if any(not a.closed and a is not attempt for a in attempts):
+                    attempt.closed = True
+                    continue
+                if LLM_HEDGING_ENABLED and len(attempts) == 1:
+                    attempt.closed = True
+                    hedge(f"primary failed: {payload}")
+                    continue
+                raise payload
+            if kind == "end":
+                if winner is None:
+                    # Finished without content, e.g. an empty response
+                    log("winner", attempt=attempt.name, model=attempt.model, empty=True)
+                return
+            if winner is None:
+                if not _has_content(payload):
+                    continue
+                winner = attempt
+                if attempt is attempts[0]:
+                    # Only the time to first token of the request itself: a hedge that won says nothing about how
+                    # long the request would have taken, and its time includes the wait before it was sent
+                    tracker.record(time.perf_counter() - attempt.started)
+                log("winner", attempt=attempt.name, model=attempt.model,
+                    ttft_ms=round((time.perf_counter() - attempt.started) * 1000, 1))
+                for other in attempts:
+                    if other is not winner:
+                        other.close()
+            yield payload
+    finally:
+        for attempt in attempts:
+            attempt.close()
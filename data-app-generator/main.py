@@ -1,66 +1,116 @@
-from openai import OpenAI, APIError
 import streamlit as st
 import generator
-import subprocess
-import threading
+import schema_cache
+import build_service
+import response_cache
+import pipeline
+import jobs
+import prefetch
+import workspace
+import dev_server
+import preaggregation
+import telemetry
+import component_history
+import bundle_budget
 import webbrowser
 import duckdb
+import uuid
+import re
+import time
 import os
 
-# Function to create a MotherDuck connection
+# Function to start connecting to MotherDuck and loading the database list and schemas in the background
 @st.cache_resource
-def get_motherduck_connection():
-    return duckdb.connect(database='md:', read_only=False)
+def get_prefetcher():
+    # A local DuckDB file can stand in for MotherDuck, e.g. for tests
+    return prefetch.CatalogPrefetcher(lambda: duckdb.connect(database=os.getenv('MOTHERDUCK_DATABASE', 'md:'), read_only=False))
+
+# Function to drop a prefetcher whose connection failed, so the next run connects again
+def reset_prefetcher():
+    prefetcher = get_prefetcher()
+    if prefetcher.failed:
+        get_prefetcher.clear()
+        prefetcher.close()
+
+# Function to return the pool of cursors shared by all sessions and jobs, waits for the connection if needed
+def get_cursor_pool():
+    return get_prefetcher().pool()
 
 # Function to create a OpenRouter client
 @st.cache_resource
 def get_openrouter_client():
+    # Imported on first use, openai takes a while to import and is not needed to render the page
+    from openai import OpenAI
     return OpenAI(
         api_key = os.getenv('OPENROUTER_API_KEY'),
-        base_url = 'https://openrouter.ai/api/v1'
+        base_url = pipeline.OPENROUTER_BASE_URL
     )
-# Function to run npm run dev in the background
-def run_npm_dev():
-    subprocess.Popen(['npm', 'run', 'dev'], cwd='my-app/', stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, bufsize=1, universal_newlines=True)
+# Function to create the executor running generation jobs in the background
+@st.cache_resource
+def get_job_executor():
+    return jobs.JobExecutor(max_workers=int(os.getenv('JOB_WORKERS', '4')))
 
 # Function to open the app in a new tab
-def open_app():
-    webbrowser.open_new_tab('http://localhost:5173')
-
-# Function to get list of databases
-@st.cache_resource
-def get_databases():
-    result = conn.execute("SHOW ALL DATABASES").fetchall()
-    return [db[0] for db in result]
-
-# Function to get schema of selected database
-def get_database_schema(database_name):
-    conn.execute(f"USE {database_name}")
-    schema_res = conn.execute("SELECT array_to_string(list(sql), '\n') from duckdb_tables() WHERE database_name = ?", [database_name]).fetchone()
-    if schema_res is None:
-        return ""
-    return schema_res[0]
-
-def write_cursor_file(database_name, database_schema):
-    with open("my-app/.cursorrules", "w+") as f:
+def open_app(url):
+    webbrowser.open_new_tab(url)
+
+# Function to release the processes of a workspace before it is removed
+def release_workspace(app_dir):
+    build_service.stop_build_service(app_dir)
+    dev_server.stop_dev_server(app_dir)
+
+# Function to get the schema catalog of selected database, usually prefetched in the background
+def get_database_catalog(database_name):
+    with st.session_state.trace.span("schema_introspection", database=database_name) as attributes:
+        catalog = get_prefetcher().get_catalog(database_name)
+        attributes["tables"] = len(catalog["tables"])
+    return catalog
+
+def write_cursor_file(app_dir, database_name, database_schema):
+    with open(os.path.join(app_dir, ".cursorrules"), "w+") as f:
         f.write(generator.cursor_prompt.format(database_name=database_name, database_schema=database_schema))
 
-client = get_openrouter_client()
-conn = get_motherduck_connection()
+prefetcher = get_prefetcher()
 
 # Initialize session state variables
-if 'is_app_running' not in st.session_state:
-    st.session_state.is_app_running = False
 if 'show_open_app' not in st.session_state:
     st.session_state.show_open_app = False
 if 'selected_database' not in st.session_state:
     st.session_state.selected_database = None
 if 'database_schema' not in st.session_state:
     st.session_state.database_schema = None
+if 'schema_catalog' not in st.session_state:
+    st.session_state.schema_catalog = None
 if 'generated_first_component' not in st.session_state:
     st.session_state.generated_first_component = False
 if 'error_state' not in st.session_state:
     st.session_state.error_state = None
+if 'context_state' not in st.session_state:
+    st.session_state.context_state = None
+if 'session_id' not in st.session_state:
+    # The session id is kept in the URL, so a reloaded page gets its workspace and dev server back
+    session_id = st.query_params.get("session", "")
+    if not re.fullmatch(r'[0-9a-f]{32}', session_id):
+        session_id = uuid.uuid4().hex
+        st.query_params["session"] = session_id
+    st.session_state.session_id = session_id
+if 'trace' not in st.session_state:
+    # Timings of the session, summarized in the sidebar and appended to the telemetry log
+    st.session_state.trace = telemetry.Trace("session", session_id=st.session_state.session_id)
+if 'job' not in st.session_state:
+    st.session_state.job = None
+if 'bundle_report' not in st.session_state:
+    # Chunk sizes of the latest build, the sizes of earlier builds are in the workspace's history
+    st.session_state.bundle_report = None
+if 'workspace' not in st.session_state:
+    # Each session generates and builds in its own copy of the app
+    st.session_state.workspace = workspace.create_workspace(st.session_state.session_id)
+    workspace.collect_garbage(keep=[st.session_state.workspace], on_remove=release_workspace)
+else:
+    workspace.touch_workspace(st.session_state.workspace)
+# The dev server of the workspace is started once and kept alive across reruns and reloads, until it is
+# the least recently used of more than DEV_SERVER_MAX servers
+app_server = dev_server.get_dev_server(st.session_state.workspace)
 
 st.title("MotherDuck Data App Generator")
 
@@ -92,137 +142,260 @@ st.sidebar.info("""
 - If you encounter UI issues, describe them to the agent.
 
 ### Continue in Cursor
-We generate a .cursorrules file in the my-app folder containing your schema information and MotherDuck Data App specific instructions.
+We generate a .cursorrules file in your session's workspace folder (a copy of my-app, shown below) containing your schema information and MotherDuck Data App specific instructions.
 
-1. Open the my-app project in [Cursor](https://cursor.sh).
+1. Open the workspace folder in [Cursor](https://cursor.sh).
 2. Go to Settings -> General in Cursor and make sure 'Include .cursorrules file' is activated.
 4. Choose your preferred coding assistant model. We recommend using anthropic/claude-3.5-sonnet.
 5. You can now continue developing your app in Cursor.
 """)
 
-# Database selection dropdown
-databases = get_databases()
-selected_db = st.selectbox("Select a database", databases, index=0)
+st.sidebar.caption(f"Workspace: {os.path.abspath(st.session_state.workspace)}")
+
+with st.sidebar.expander("Dev server"):
+    st.json(app_server.status())
+    st.code("\n".join(app_server.log_lines()[-50:]) or "No output yet", language=None)
+    if st.button("Restart dev server"):
+        app_server.restart()
+
+with st.sidebar.expander("Timings"):
+    timing_summary = telemetry.summarize(st.session_state.trace.spans)
+    if timing_summary:
+        st.caption("Per stage of this session, in milliseconds. LLM calls include the time to first token and token totals.")
+        st.dataframe([{"stage": name, **entry} for name, entry in timing_summary.items()], hide_index=True)
+    else:
+        st.caption("No timings yet.")
+
+with st.sidebar.expander("Connection pool"):
+    try:
+        ready_pool = prefetcher.pool_if_ready()
+    except duckdb.Error:
+        # Reported with the list of databases below
+        ready_pool = None
+        st.caption("Not connected.")
+    else:
+        if ready_pool is not None:
+            st.json(ready_pool.stats())
+        else:
+            st.caption("Connecting...")
+
+use_response_cache = st.sidebar.checkbox("Reuse cached responses for identical requests", value=response_cache.RESPONSE_CACHE_ENABLED)
+candidates = st.sidebar.number_input("Parallel candidates per request", min_value=1, max_value=5, value=pipeline.GENERATION_CANDIDATES,
+                                     help="Generate several versions of the app at once and keep the first one that builds. Uses more tokens.")
+repair_attempts = st.sidebar.number_input("Automatic repair attempts", min_value=0, max_value=5, value=pipeline.REPAIR_ATTEMPTS,
+                                          help="Send build errors back to the model before asking you to fix them.")
+
+# Database selection dropdown, the list is loaded in the background while the page above renders
+try:
+    with st.spinner("Loading databases..."):
+        databases = prefetcher.databases()
+except duckdb.Error as e:
+    st.error(f"Could not load the list of databases: {e}")
+    reset_prefetcher()
+    st.stop()
+recent_databases = prefetch.load_recent_databases()
+default_index = next((databases.index(name) for name in recent_databases if name in databases), 0)
+selected_db = st.selectbox("Select a database", databases, index=default_index)
 
 if selected_db is not None and selected_db != st.session_state.selected_database:
     st.session_state.selected_database = selected_db
-    st.session_state.database_schema = get_database_schema(selected_db)
+    prefetch.record_database_use(selected_db)
+    st.session_state.schema_catalog = get_database_catalog(selected_db)
+    st.session_state.database_schema = schema_cache.render_schema(st.session_state.schema_catalog)
+    # The .cursorrules file keeps the full schema, since later Cursor prompts are not known upfront
+    write_cursor_file(st.session_state.workspace, selected_db, st.session_state.database_schema)
     st.success(f"Connected to database: {selected_db}")
 
+if preaggregation.PREAGGREGATION_ENABLED and st.session_state.selected_database:
+    with st.sidebar.expander("Pre-aggregations"):
+        entries = [e for e in preaggregation.load_manifest().values() if e["database"] == st.session_state.selected_database]
+        st.caption(f"Summary tables in the {preaggregation.PREAGGREGATION_SCHEMA} schema that generated apps read instead of raw tables")
+        for entry in entries:
+            st.markdown(f"`{entry['table']}`: {entry['rows']} rows, refreshed {time.strftime('%Y-%m-%d %H:%M', time.localtime(entry['refreshed_at']))}")
+        if entries and st.button("Refresh pre-aggregations"):
+            with get_cursor_pool().cursor() as cursor:
+                refreshed = preaggregation.refresh(cursor, st.session_state.selected_database)
+            st.success(f"Refreshed {len(refreshed)} tables")
+
 if "messages" not in st.session_state:
     st.session_state.messages = []
 
-for message in st.session_state.messages:
-    with st.chat_message(message["role"]):
-        st.markdown(message["content"])
-
-if prompt := st.chat_input("What can I do for you?"):
-    st.session_state.messages_internal = []
-    st.session_state.messages_internal.append({"role": "system", "content": generator.generator_prompt})
-    st.session_state.messages_internal += st.session_state.messages
-    st.session_state.messages.append({"role": "user", "content": prompt})
+# Function to bring back an earlier version of the component as a job, its progress shows like a generation's
+def restore_version(version):
+    app_dir = st.session_state.workspace
+    builder = build_service.get_build_service(app_dir)
+    st.session_state.job = get_job_executor().submit(
+        st.session_state.session_id,
+        lambda job: pipeline.run_restore(job, app_dir, version, builder),
+        pipeline.RESTORE_STAGES,
+    )
 
-    # Append database schema to the prompt
-    schema = st.session_state.database_schema if st.session_state.database_schema else ""
-    database = st.session_state.selected_database if st.session_state.selected_database else ""
-    if not st.session_state.generated_first_component:
-        internal_prompt = f"Here's the schema of the selected database: \n{database} \nAlways prepend the database name to the table name when you generate queries ({database}.<table_name>):\n{schema}\n\nUser instruction: {prompt}"
+with st.sidebar.expander("Version history"):
+    versions = component_history.list_versions(st.session_state.workspace)
+    if versions:
+        st.caption("Every turn's component, newest first. Restoring a version that was built before reuses its build.")
+        labels = {v["hash"]: f"{time.strftime('%H:%M:%S', time.localtime(v['created_at']))} · {v['hash'][:8]} · "
+                             f"{'built' if v['ok'] else 'failed'} · {v['prompt'][:60]}" for v in reversed(versions)}
+        selected_hash = st.selectbox("Version", list(labels), format_func=labels.get)
+        job_running = st.session_state.job is not None and not st.session_state.job.is_done
+        if st.button("Restore this version", disabled=job_running or selected_hash == versions[-1]["hash"]):
+            restore_version(next(v for v in versions if v["hash"] == selected_hash))
+            st.rerun()
     else:
-        with open("my-app/src/components/MyApp.jsx", "r") as f:
-            app_code = f.read()
-
-        internal_prompt = f"You are connected to database: \n{database} \n"\
-        f"Always prepend the database name to the table name when you generate queries ({database}.<table_name>). \n"\
-        f"Here is the schema of the database: \n{schema}\n"\
-        f"Here is the user's current app: \n<component>{app_code}<component>\n\n"
+        st.caption("No versions yet.")
+
+if bundle_budget.BUNDLE_BUDGET_MODE != 'off':
+    with st.sidebar.expander("Bundle size"):
+        bundle_history = bundle_budget.load_history(st.session_state.workspace)
+        if bundle_history:
+            st.caption(f"Gzipped JavaScript and CSS of every build, in KB. Budget: {bundle_budget.BUNDLE_BUDGET_INITIAL_KB:.0f} KB "
+                       f"loaded initially, {bundle_budget.BUNDLE_BUDGET_CHUNK_KB:.0f} KB per chunk.")
+            st.line_chart([{"initial": entry["initial_gzip_kb"], "lazy": entry["lazy_gzip_kb"]} for entry in bundle_history])
+            # The latest build of this session, or the last one recorded in the workspace after a reload
+            report = st.session_state.bundle_report or bundle_history[-1]
+            if "chunks" in report:
+                for violation in report["violations"]:
+                    st.warning(violation)
+                st.dataframe([{"chunk": c["source"], "gzip KB": c["gzip_kb"], "KB": c["kb"], "loaded": "initially" if c["initial"] else "lazily"}
+                              for c in report["chunks"]], hide_index=True)
+        else:
+            st.caption("No builds yet.")
+
+# Function to apply the outcome of a finished generation job to the session
+def apply_job_result(job):
+    restoring = job.stages == pipeline.RESTORE_STAGES
+    if job.status == jobs.SUCCEEDED and restoring:
+        result = job.result
+        st.session_state.error_state = result["error_state"]
+        st.session_state.show_open_app = result["show_open_app"]
+        if result["bundle"] is not None:
+            st.session_state.bundle_report = result["bundle"]
+        st.session_state.messages.append({"role": "assistant", "content": result["summary"], "is_note": True})
+    elif job.status == jobs.SUCCEEDED:
+        result = job.result
+        st.session_state.messages_internal = result["messages_internal"]
+        st.session_state.context_state = result["context_state"]
+        st.session_state.error_state = result["error_state"]
+        if result["show_open_app"] is not None:
+            st.session_state.show_open_app = result["show_open_app"]
+        token_counts = result["token_counts"]
+        caption = f"~{token_counts['total']} prompt tokens (system {token_counts['system']}, "\
+                  f"summary {token_counts['summary']}, history {token_counts['history']}, instruction {token_counts['prompt']})"
+        if result.get("candidates"):
+            outcomes = ", ".join(f"#{c['index'] + 1} at {c['temperature']}: {'selected' if c['selected'] else 'built' if c['ok'] else 'failed'}"
+                                 for c in result["candidates"])
+            caption += f" · candidates {outcomes}"
+        if result.get("query_budget"):
+            actions = [finding["action"] for finding in result["query_budget"]]
+            caption += f" · {len(actions)} queries over the row/scan budget ({', '.join(f'{actions.count(a)} {a}' for a in dict.fromkeys(actions))})"
+        if result.get("preaggregations"):
+            caption += f" · {len(result['preaggregations'])} queries read pre-aggregated tables"
+        if result["build_result"] is not None and result["build_result"].get("cached"):
+            caption += " · build reused"
+        if result.get("bundle"):
+            bundle = result["bundle"]
+            st.session_state.bundle_report = bundle
+            caption += f" · {bundle['initial_gzip_kb']:.0f} KB initial JS/CSS (gzip){', over budget' if bundle['violations'] else ''}"
+        if result.get("repair_attempts"):
+            attempts = result["repair_attempts"]
+            caption += f" · {'fixed' if attempts[-1]['ok'] else 'not fixed'} automatically after {len(attempts)} attempt(s)"
+        st.session_state.messages.append({"role": "assistant", "content": result["summary"], "caption": caption})
+    elif job.status == jobs.FAILED:
+        print(f"{'Restore' if restoring else 'Generation'} failed: {job.error!r}")
+        from openai import APIError
+        if restoring:
+            error = f"An error occurred while restoring the version: {str(job.error)}"
+        elif isinstance(job.error, APIError):
+            error = f"An error occurred while communicating with the API: {str(job.error)}. Please try again later or contact support if the problem persists."
+        else:
+            error = f"An error occurred while generating the app: {str(job.error)}"
+        st.session_state.messages.append({"role": "assistant", "content": error, "is_error": True})
+    elif job.status == jobs.CANCELLED:
+        st.session_state.messages.append({"role": "assistant", "content": "_Cancelled._", "is_note": True})
+    st.session_state.job = None
+
+# Poll the running job, the rest of the app stays responsive while it runs
+@st.fragment(run_every=1)
+def show_job_progress():
+    job = st.session_state.job
+    if job is None:
+        return
+    if job.is_done:
+        apply_job_result(job)
+        st.rerun()
+    snapshot = job.snapshot()
+    with st.chat_message("assistant"):
+        stage_index = max(snapshot["stage_index"], 0)
+        st.progress((stage_index + 1) / len(snapshot["stages"]),
+                    text=f"{snapshot['message'] or snapshot['stage']} ({snapshot['elapsed']:.0f}s)")
+        if st.button("Cancel", key=f"cancel_job_{snapshot['id']}"):
+            job.cancel()
 
-        if st.session_state.error_state:
-            internal_prompt = internal_prompt + "I encountered an error with the following message: " + st.session_state.error_state + f"\nUser instruction: {prompt}"
-            st.session_state.error_state = None
+for message in st.session_state.messages:
+    with st.chat_message(message["role"]):
+        if message.get("is_error"):
+            st.error(message["content"])
         else:
-            internal_prompt = internal_prompt + f"User instruction: {prompt}"
+            st.markdown(message["content"])
+        if message.get("caption"):
+            st.caption(message["caption"])
+        is_last_answer = message is st.session_state.messages[-1] and message["role"] == "assistant"
+        if is_last_answer and st.session_state.error_state and st.session_state.job is None:
+            st.error(f"An error occurred during the build process: {st.session_state.error_state}. \nDo you want me to fix it?")
 
-    st.session_state.messages_internal.append({"role": "user", "content": internal_prompt})
-    write_cursor_file(database, schema)
+if prompt := st.chat_input("What can I do for you?"):
+    if st.session_state.job is not None and not st.session_state.job.is_done:
+        # A new prompt supersedes the running job
+        st.session_state.job.cancel()
+        st.session_state.messages.append({"role": "assistant", "content": "_Superseded by a newer request._", "is_note": True})
+        st.session_state.job = None
+    request = pipeline.GenerationRequest(
+        prompt=prompt,
+        history=[{"role": m["role"], "content": m["content"]} for m in st.session_state.messages
+                 if not m.get("is_error") and not m.get("is_note")],
+        database=st.session_state.selected_database if st.session_state.selected_database else "",
+        catalog=st.session_state.schema_catalog,
+        error_state=st.session_state.error_state,
+        is_first_component=not st.session_state.generated_first_component,
+        context_state=st.session_state.context_state,
+        use_response_cache=use_response_cache,
+        app_dir=st.session_state.workspace,
+        candidates=candidates,
+        repair_attempts=repair_attempts,
+        trace=st.session_state.trace,
+    )
+    st.session_state.messages.append({"role": "user", "content": prompt})
+    st.session_state.error_state = None
+    st.session_state.generated_first_component = True
 
     with st.chat_message("user"):
         st.markdown(prompt)
 
-    response = ""
+    client = get_openrouter_client()
+    pool = get_cursor_pool()
+    builder = build_service.get_build_service(st.session_state.workspace)
+    st.session_state.job = get_job_executor().submit(
+        st.session_state.session_id,
+        lambda job: pipeline.run_generation(job, request, pool, client, builder),
+        pipeline.STAGES,
+    )
 
-    if not st.session_state.generated_first_component:
-        spinner_text = "Generating app, please wait..."
-        st.session_state.generated_first_component = True
+if st.session_state.job is not None:
+    show_job_progress()
+
+# "Open App" button, shown once the dev server accepts connections
+@st.fragment(run_every=2)
+def show_open_app_button():
+    # Looked up on every run: the server of the script run may have been evicted since, and the lookup
+    # keeps an app that is open from being the least recently used
+    server = dev_server.get_dev_server(st.session_state.workspace)
+    if server.is_healthy():
+        if st.button("Open App"):
+            open_app(server.url)
+    elif server.gave_up:
+        st.error("The dev server keeps crashing, see its log in the sidebar.")
     else:
-        spinner_text = "Updating app, please wait..."
-
-    # Show spinner while generating the code
-    with st.spinner(spinner_text):
-        # extract myapp.tsx
-        completion = client.chat.completions.create(
-            extra_headers = {
-                "HTTP-Referer": "https://motherduck.com/",
-                "X-Title": "MotherDuck Data App Generator"
-            },
-            model="anthropic/claude-3.5-sonnet",
-            messages=[
-                {"role": m["role"], "content": m["content"]}
-                for m in st.session_state.messages_internal
-            ],
-            timeout=90
-        )
-
-        response = completion.choices[0].message.content
-        print(response)
-        st.session_state.messages_internal.append({"role": "assistant", "content": response})
-
-        # write to MyApp.tsx
-        clean_text, component_code = generator.extract_component(response)
-        if component_code != "":
-            with open("my-app/src/components/MyApp.jsx", "w+") as f:
-                f.write(component_code)
-            # Run npm run build
-            try:
-                result = subprocess.run(['npm', 'run', 'build'], cwd='my-app/', capture_output=True, text=True, check=True)
-                print("npm run build output:", result.stdout)
-                # Show the "Open App" button when new code is written
-                st.session_state.show_open_app = True
-            except subprocess.CalledProcessError as e:
-                error_message = f"Error running npm run build: {e.stderr}"
-                print(error_message)
-                # Display error message in the UI
-                st.session_state.error_state = error_message
-                st.session_state.show_open_app = False
+        st.info("Waiting for the dev server to start...")
 
-    with st.chat_message("assistant"):
-        try:
-            stream = client.chat.completions.create(
-                extra_headers = {
-                    "HTTP-Referer": "https://motherduck.com/",
-                    "X-Title": "MotherDuck Data App Generator"
-                },
-                model="anthropic/claude-3.5-sonnet",
-                messages= st.session_state.messages[-1:] +
-                          [{"role": "assistant", "content": response},
-                          {"role": "user", "content": "Summarize the changes you have done in one sentence"}],
-                stream=True,
-                timeout=60
-            )
-            response = st.write_stream(stream)
-            st.session_state.messages.append({"role": "assistant", "content": response})
-            if st.session_state.error_state:
-                st.error(f"An error occurred during the build process: {st.session_state.error_state}. \nDo you want me to fix it?")
-
-        except APIError as e:
-            st.error(f"An error occurred while communicating with the API: {str(e)}")
-            st.info("Please try again later or contact support if the problem persists.")
-
-# "Open App" button
 if st.session_state.show_open_app:
-    if st.button("Open App"):
-        open_app()
-
-if not st.session_state.is_app_running:
-    st.session_state.npm_thread = threading.Thread(target=run_npm_dev)
-    st.session_state.npm_thread.start()
-    st.session_state.is_app_running = True
+    show_open_app_button()
@@ -0,0 +1,104 @@
+/* eslint-env node */
+// Long-lived build worker used by the data app generator (see build_service.py).
+// Keeps Vite warm in watch mode so a change to a component only recompiles the changed modules.
+// Build requests are read from stdin as JSON lines ({"id": 1, "since": <file mtime in ms>}) and
+// answered on stdout with the outcome of the first build that started after `since`.
+import readline from 'node:readline'
+import { build } from 'vite'
+
+// Restart the watcher if a requested change did not trigger a build within this time
+const STALL_TIMEOUT_MS = 3000
+
+let watcher = null
+let building = false
+let currentBuild = null
+let lastBuild = null
+let pending = []
+
+function send(message) {
+  process.stdout.write(JSON.stringify(message) + '\n')
+}
+
+function toError(error) {
+  const loc = error.loc || {}
+  return {
+    file: loc.file || error.id || null,
+    line: loc.line ?? null,
+    column: loc.column ?? null,
+    message: error.message,
+    frame: error.frame || null,
+    plugin: error.plugin || null,
+  }
+}
+
+function settle() {
+  if (building || !lastBuild) {
+    return
+  }
+  pending = pending.filter((request) => {
+    if (lastBuild.startedAt < request.since) {
+      return true
+    }
+    send({
+      id: request.id,
+      ok: lastBuild.errors.length === 0,
+      errors: lastBuild.errors,
+      duration_ms: lastBuild.endedAt - lastBuild.startedAt,
+    })
+    return false
+  })
+}
+
+async function startWatcher() {
+  if (watcher) {
+    await watcher.close()
+  }
+  watcher = await build({ logLevel: 'warn', build: { watch: {} } })
+  watcher.on('event', (event) => {
+    switch (event.code) {
+      case 'START':
+        building = true
+        currentBuild = { startedAt: Date.now(), errors: [] }
+        break
+      case 'ERROR':
+        currentBuild.errors.push(toError(event.error))
+        event.result?.close()
+        break
+      case 'BUNDLE_END':
+        event.result?.close()
+        break
+      case 'END':
+        lastBuild = { ...currentBuild, endedAt: Date.now() }
+        building = false
+        settle()
+        break
+    }
+  })
+}
+
+function checkStalled(request) {
+  const isPending = pending.includes(request)
+  const hasStarted = building || (lastBuild && lastBuild.startedAt >= request.since)
+  if (isPending && !hasStarted) {
+    console.error('build-server: change was not picked up by the watcher, restarting it')
+    startWatcher().catch((error) => console.error('build-server:', error))
+  }
+}
+
+readline.createInterface({ input: process.stdin }).on('line', (line) => {
+  let request
+  try {
+    request = JSON.parse(line)
+  } catch {
+    console.error(`build-server: ignoring invalid request ${line}`)
+    return
+  }
+  pending.push(request)
+  settle()
+  setTimeout(() => checkStalled(request), STALL_TIMEOUT_MS)
+}).on('close', () => process.exit(0))
+
+startWatcher().catch((error) => {
+  console.error('build-server:', error)
+  process.exit(1)
+})
@@ -0,0 +1,84 @@
+import { MDConnection } from "@motherduck/wasm-client";
+import { useEffect, useState } from "react";
+
+// Shared query layer of the app: every component uses one MotherDuck connection, identical queries
+// that are running at the same time are sent once, and results are kept in a small LRU cache.
+const DEFAULT_TTL_MS = 60 * 1000;
+const MAX_CACHED_RESULTS = 100;
+
+let sharedConnection = null;
+// Query text -> promise of its result, while the query runs
+const inFlight = new Map();
+// Query text -> { result, expiresAt }, the least recently used entry first
+const resultCache = new Map();
+
+export function getConnection() {
+    if (!sharedConnection) {
+        sharedConnection = MDConnection.create({
+            mdToken: import.meta.env.VITE_MOTHERDUCK_TOKEN,
+        });
+    }
+    return sharedConnection;
+}
+
+function readCache(key) {
+    const entry = resultCache.get(key);
+    if (!entry) return undefined;
+    resultCache.delete(key);
+    if (entry.expiresAt <= Date.now()) return undefined;
+    // Re-insert to mark the entry as most recently used
+    resultCache.set(key, entry);
+    return entry.result;
+}
+
+function writeCache(key, result, ttl) {
+    resultCache.set(key, { result, expiresAt: Date.now() + ttl });
+    while (resultCache.size > MAX_CACHED_RESULTS) {
+        resultCache.delete(resultCache.keys().next().value);
+    }
+}
+
+// Runs a query on the shared connection. Pass { ttl: 0 } for results that must always be fresh.
+export function runQuery(sql, { ttl = DEFAULT_TTL_MS } = {}) {
+    const key = sql.trim();
+    const cached = ttl > 0 ? readCache(key) : undefined;
+    if (cached) return Promise.resolve(cached);
+    if (inFlight.has(key)) return inFlight.get(key);
+
+    const promise = getConnection()
+        .evaluateQuery(key)
+        .then((result) => {
+            if (ttl > 0) writeCache(key, result, ttl);
+            return result;
+        })
+        .finally(() => inFlight.delete(key));
+    inFlight.set(key, promise);
+    return promise;
+}
+
+export function clearQueryCache() {
+    resultCache.clear();
+}
+
+// Hook running a query whenever its text changes, returns { rows, loading, error }
+export function useQuery(sql, { ttl = DEFAULT_TTL_MS, enabled = true } = {}) {
+    const [state, setState] = useState({ rows: null, loading: enabled && !!sql, error: null });
+
+    useEffect(() => {
+        if (!enabled || !sql) return;
+        let isCurrent = true;
+        setState((previous) => ({ ...previous, loading: true, error: null }));
+        runQuery(sql, { ttl })
+            .then((result) => {
+                if (isCurrent) setState({ rows: result.data.toRows(), loading: false, error: null });
+            })
+            .catch((error) => {
+                if (isCurrent) setState({ rows: null, loading: false, error });
+            });
+        return () => {
+            isCurrent = false;
+        };
+    }, [sql, ttl, enabled]);
+
+    return state;
+}
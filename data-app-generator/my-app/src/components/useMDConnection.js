@@ -1,18 +1,11 @@
-import { MDConnection } from "@motherduck/wasm-client";
 import { useCallback, useState } from "react";
+import { getConnection } from "./mdQuery";
 
+// All components share the connection of the query layer, see mdQuery.js
 export function useMDConnection() {
     const [connection, setConnection] = useState(null);
     const connect = useCallback(() => {
-        if (!connection) {
-            setConnection(
-                MDConnection.create({
-                    mdToken: import.meta.env.VITE_MOTHERDUCK_TOKEN,
-                })
-            );
-        } else {
-            console.warn("Connection to MotherDuck exists!");
-        }
-    }, [connection]);
+        setConnection(getConnection());
+    }, []);
     return { connection, connect };
-}
\ No newline at end of file
+}
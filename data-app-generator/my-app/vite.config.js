@@ -9,6 +9,10 @@ export default defineConfig({
       '@': path.resolve(__dirname, './src'),
     },
   },
+  build: {
+    // dist/.vite/manifest.json lists the chunks of the build, read by bundle_budget.py
+    manifest: true,
+  },
   server: {
     headers: {
       'Cross-Origin-Opener-Policy': 'same-origin',
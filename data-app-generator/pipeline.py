@@ -0,0 +1,525 @@
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import nullcontext
+from dataclasses import dataclass
+
+import build_service
+import bundle_budget
+import component_history
+import component_sql
+import context_builder
+import generator
+import jobs
+import llm_requests
+import preaggregation
+import query_budget
+import response_cache
+import schema_index
+import schema_stats
+import telemetry
+import workspace
+
+MODEL = "anthropic/claude-3.5-sonnet"
+# Any OpenAI compatible endpoint works, e.g. the stub server of benchmark.py
+OPENROUTER_BASE_URL = os.getenv('OPENROUTER_BASE_URL', 'https://openrouter.ai/api/v1')
+OPENROUTER_HEADERS = {
+    "HTTP-Referer": "https://motherduck.com/",
+    "X-Title": "MotherDuck Data App Generator"
+}
+
+STAGES = ["prepare", "generate", "validate", "preaggregate", "build", "repair", "summarize"]
+RESTORE_STAGES = ["restore", "build"]
+
+# Seconds a turn may take in total; LLM requests are cut short at the deadline, repairs and the summary request are skipped
+TURN_DEADLINE = float(os.getenv('TURN_DEADLINE', '300'))
+
+# Number of candidate components generated in parallel per turn, 1 disables best-of-N generation
+GENERATION_CANDIDATES = int(os.getenv('GENERATION_CANDIDATES', '1'))
+# Sampling temperatures of the candidates, reused round-robin when there are more candidates than values
+CANDIDATE_TEMPERATURES = [float(t) for t in os.getenv('CANDIDATE_TEMPERATURES', '0.2,0.6,1.0').split(',')]
+
+# Number of times a component that fails validation or the build is sent back to the model, 0 disables it
+REPAIR_ATTEMPTS = int(os.getenv('REPAIR_ATTEMPTS', '2'))
+REPAIR_ERROR_MAX_LINES = int(os.getenv('REPAIR_ERROR_MAX_LINES', '30'))
+
+REPAIR_PROMPT = """The app failed with the following error:
+{error}
+
+Fix the error and return the full updated component. Do not change anything that is unrelated to the error."""
+
+# Lines of a code frame like "> 12 |   const x = ..." or "    |     ^"
+CODE_FRAME_LINE_PATTERN = re.compile(r'^\s*>?\s*\d*\s*\|')
+# Lines of build output that never help the model fix the component
+NOISE_LINE_PATTERN = re.compile(r'^\s*(at |npm (ERR|error)|> \S+@\S+ |error during build:?$)|node_modules/')
+
+# Everything a generation job needs from the session, captured when the prompt is submitted
+@dataclass
+class GenerationRequest:
+    prompt: str
+    history: list
+    database: str
+    catalog: dict = None
+    error_state: str = None
+    is_first_component: bool = True
+    context_state: dict = None
+    use_response_cache: bool = True
+    app_dir: str = "my-app/"
+    candidates: int = 1
+    repair_attempts: int = 0
+    # Session trace the spans of the turn are added to, a trace of its own if None
+    trace: object = None
+
+    @property
+    def component_path(self):
+        return os.path.join(self.app_dir, "src/components/MyApp.jsx")
+
+# Function to build the schema section of the prompt, optionally enriched with column statistics
+def get_schema_context(pool, catalog, instruction, app_code=""):
+    selected_tables = schema_index.select_tables(catalog, instruction, app_code)
+    schema = schema_index.render_selection(catalog, selected_tables)
+    if schema_stats.SCHEMA_STATS_ENABLED and selected_tables:
+        stats = schema_stats.get_stats(pool, catalog, selected_tables[:schema_stats.SCHEMA_STATS_MAX_TABLES])
+        if stats:
+            schema += "\n\nColumn statistics (use them to pick filters and avoid full scans):\n" + schema_stats.render_stats(stats)
+    return schema
+
+# Function to build the user message of a turn from the schema, the current app and the instruction
+def build_internal_prompt(pool, request):
+    prompt = request.prompt
+    database = request.database
+    if request.is_first_component:
+        # Append the relevant part of the database schema to the prompt
+        schema = get_schema_context(pool, request.catalog, prompt)
+        return f"Here's the schema of the selected database: \n{database} \nAlways prepend the database name to the table name when you generate queries ({database}.<table_name>):\n{schema}\n\nUser instruction: {prompt}"
+
+    with open(request.component_path, "r") as f:
+        app_code = f.read()
+    schema = get_schema_context(pool, request.catalog, prompt, app_code)
+
+    internal_prompt = f"You are connected to database: \n{database} \n"\
+    f"Always prepend the database name to the table name when you generate queries ({database}.<table_name>). \n"\
+    f"Here is the schema of the database: \n{schema}\n"\
+    f"Here is the user's current app: \n<component>{app_code}<component>\n\n"
+
+    if request.error_state:
+        internal_prompt = internal_prompt + "I encountered an error with the following message: " + request.error_state + f"\nUser instruction: {prompt}"
+    else:
+        internal_prompt = internal_prompt + f"User instruction: {prompt}"
+    return internal_prompt
+
+# Function to stream the text of a completion request, hedged against a slow first token (see llm_requests).
+# With a trace, the call is recorded as an "llm" span with its time to first token, token counts (estimated
+# if the endpoint reports no usage) and hedging decisions. deadline is a time.monotonic() value, the stream
+# ends early once cancel_event is set.
+def stream_completion(client, messages, timeout=90, temperature=None, trace=None, purpose="generate", deadline=None, cancel_event=None):
+    options = {} if temperature is None else {"temperature": temperature}
+    span = trace.span("llm", purpose=purpose, model=MODEL, temperature=temperature) if trace is not None else nullcontext({})
+    with span as attributes:
+        started = time.perf_counter()
+        decisions = []
+
+        def create(model):
+            request_timeout = timeout if deadline is None else max(1, min(timeout, deadline - time.monotonic()))
+            return client.chat.completions.create(
+                extra_headers = OPENROUTER_HEADERS,
+                model=model,
+                messages=messages,
+                stream=True,
+                stream_options={"include_usage": True},
+                timeout=request_timeout,
+                **options
+            )
+
+        stream = llm_requests.hedged_stream(create, MODEL, purpose=purpose, deadline=deadline, decisions=decisions, cancel_event=cancel_event)
+        completion_chars = 0
+        try:
+            for chunk in stream:
+                if getattr(chunk, "usage", None):
+                    attributes.update(prompt_tokens=chunk.usage.prompt_tokens, completion_tokens=chunk.usage.completion_tokens)
+                delta = chunk.choices[0].delta.content if chunk.choices else None
+                if delta:
+                    if not completion_chars:
+                        attributes["ttft_ms"] = round((time.perf_counter() - started) * 1000, 1)
+                    completion_chars += len(delta)
+                    yield delta
+        finally:
+            stream.close()
+            attributes["completion_chars"] = completion_chars
+            winner = next((d for d in decisions if d["decision"] == "winner"), None)
+            attributes.update(hedged=any(d["decision"] == "hedge" for d in decisions), decisions=decisions,
+                              served_by=winner["model"] if winner else None)
+            if "completion_tokens" not in attributes:
+                attributes.update(prompt_tokens=sum(schema_index.estimate_tokens(m["content"]) for m in messages),
+                                  completion_tokens=(completion_chars + 3) // 4, tokens_estimated=True)
+
+# Function to cap the queries of a component to the row and scan budget, before it is written.
+# Returns the component and the queries that were over budget.
+def budget_queries(pool, catalog, component_code, trace):
+    if not query_budget.QUERY_BUDGET_ENABLED:
+        return component_code, []
+    with trace.span("query_budget") as attributes:
+        component_code, findings = query_budget.enforce_budget(pool, component_code, catalog)
+        attributes.update(over_budget=len(findings), rewritten=sum(f["rewritten_sql"] is not None for f in findings))
+    return component_code, findings
+
+# Function to generate, validate and build one candidate component in its own scratch workspace.
+# Returns None when the candidate was abandoned because another one already succeeded.
+def generate_candidate(job, index, temperature, messages, pool, client, app_dir, catalog, done_event, trace):
+    parser = generator.ComponentStreamParser()
+    chunks = stream_completion(client, messages, temperature=temperature, trace=trace.bind(candidate=index), purpose="candidate",
+                               deadline=job.deadline, cancel_event=done_event)
+    try:
+        for delta in chunks:
+            job.check_cancelled()
+            if done_event.is_set():
+                return None
+            parser.feed(delta)
+    finally:
+        chunks.close()
+    if done_event.is_set():
+        return None
+
+    candidate = {"index": index, "temperature": temperature, "app_dir": app_dir, "response": parser.text,
+                 "component_code": parser.component_code, "query_errors": [], "query_budget": [], "build_result": None}
+    if parser.component_code is None or done_event.is_set():
+        return candidate
+    candidate["component_code"], candidate["query_budget"] = budget_queries(pool, catalog, parser.component_code, trace.bind(candidate=index))
+    component_path = os.path.join(app_dir, "src/components/MyApp.jsx")
+    with open(component_path, "w") as f:
+        f.write(candidate["component_code"])
+    if component_sql.SQL_VALIDATION_ENABLED:
+        candidate["query_errors"] = component_sql.validate_component(pool, candidate["component_code"])
+        if candidate["query_errors"]:
+            return candidate
+    job.check_cancelled()
+    candidate["build_result"] = build_service.get_build_service(app_dir).build(component_path)
+    trace.record("build", candidate["build_result"]["duration_ms"], ok=candidate["build_result"]["ok"],
+                 cached=candidate["build_result"].get("cached", False), candidate=index)
+    return candidate
+
+def _candidate_succeeded(candidate):
+    return candidate is not None and not candidate["query_errors"] and candidate["build_result"] is not None and candidate["build_result"]["ok"]
+
+# Function to generate several candidates at once at different temperatures and build them side by side.
+# Returns the first candidate that validates and builds, or the first one with a component if none does,
+# together with every candidate that finished. The turn does not wait for the other candidates: they stop
+# streaming at once, a build in progress runs to its end in the background. The build service of every
+# scratch workspace is stopped when its candidate is done, so no Vite worker outlives the turn.
+def run_candidates(job, request, messages, pool, client, trace):
+    done_event = threading.Event()
+    scratch_dirs = [workspace.create_scratch_workspace(request.app_dir, f"candidate{i}") for i in range(request.candidates)]
+    finished = []
+    errors = []
+    executor = ThreadPoolExecutor(max_workers=request.candidates, thread_name_prefix="candidate")
+    futures = [
+        executor.submit(generate_candidate, job, i, CANDIDATE_TEMPERATURES[i % len(CANDIDATE_TEMPERATURES)],
+                        messages, pool, client, app_dir, request.catalog, done_event, trace)
+        for i, app_dir in enumerate(scratch_dirs)
+    ]
+    for future, app_dir in zip(futures, scratch_dirs):
+        future.add_done_callback(lambda _, app_dir=app_dir: build_service.stop_build_service(app_dir))
+    try:
+        for future in as_completed(futures):
+            try:
+                candidate = future.result()
+            except jobs.JobCancelled:
+                raise
+            except Exception as e:
+                # One failing request should not fail the turn while other candidates are still running
+                print(f"Candidate failed: {e}")
+                errors.append(e)
+                continue
+            if candidate is None:
+                continue
+            finished.append(candidate)
+            if _candidate_succeeded(candidate):
+                # Abandon the candidates still streaming or building
+                done_event.set()
+                return candidate, finished
+            job.update(f"Candidate {candidate['index'] + 1} failed, {request.candidates - len(finished) - len(errors)} remaining...")
+    finally:
+        done_event.set()
+        executor.shutdown(wait=False, cancel_futures=True)
+    if not finished:
+        raise errors[0]
+    with_component = [c for c in finished if c["component_code"] is not None]
+    return (with_component or finished)[0], finished
+
+# Function to cut an error message down to the lines the model needs: no stack traces or npm noise, at most max_lines
+def trim_error(error, max_lines=REPAIR_ERROR_MAX_LINES):
+    lines = [line for line in error.splitlines() if line.strip() and not NOISE_LINE_PATTERN.search(line)]
+    if len(lines) > max_lines:
+        lines = lines[:max_lines] + [f"... ({len(lines) - max_lines} more lines)"]
+    return "\n".join(lines)
+
+# Errors that only differ in their location or code frame are the same error
+def error_signature(error):
+    lines = [line for line in trim_error(error).splitlines() if not CODE_FRAME_LINE_PATTERN.match(line)]
+    return re.sub(r':\d+(:\d+)?', ':#', "\n".join(lines))
+
+# Function to replace expensive static aggregations of a written component with summary tables,
+# returns the component as it is now on disk
+def preaggregate_component(pool, request, component_code, result):
+    component_code, materialized = preaggregation.apply_preaggregations(pool, request.database, component_code)
+    if materialized:
+        with open(request.component_path, "w") as f:
+            f.write(component_code)
+        result.setdefault("preaggregations", []).extend(e["table"] for e in materialized)
+    return component_code
+
+# Function to measure the bundle of a successful build against the budget. Returns the error to report
+# if the budget fails builds over it, None otherwise. Builds that were not run here, e.g. known from the
+# response cache, are not measured.
+def check_bundle(request, build_result, component_code, result, trace):
+    if not build_result["ok"] or "dist_dir" not in build_result:
+        return None
+    with trace.span("bundle") as attributes:
+        report = bundle_budget.record_build(request.app_dir, build_result["dist_dir"], component_history.component_hash(component_code))
+        if report is not None:
+            attributes.update(initial_gzip_kb=report["initial_gzip_kb"], lazy_gzip_kb=report["lazy_gzip_kb"], status=report["status"])
+    result["bundle"] = report
+    if report is not None and report["status"] == "fail":
+        return bundle_budget.format_violations(report)
+    return None
+
+# Function to validate and build a component written to the app, returns the error message or None
+def check_component(pool, builder, request, component_code, result, trace):
+    if component_sql.SQL_VALIDATION_ENABLED:
+        with trace.span("validate") as attributes:
+            query_errors = component_sql.validate_component(pool, component_code)
+            attributes["query_errors"] = len(query_errors)
+        if query_errors:
+            return component_sql.format_query_errors(query_errors), None
+    if preaggregation.PREAGGREGATION_ENABLED:
+        with trace.span("preaggregate"):
+            result["component_code"] = preaggregate_component(pool, request, component_code, result)
+    build_result = builder.build(request.component_path)
+    trace.record("build", build_result["duration_ms"], ok=build_result["ok"], cached=build_result.get("cached", False))
+    if not build_result["ok"]:
+        return build_service.format_build_errors(build_result, request.app_dir), build_result
+    # Measure the component as written to the app, which preaggregation may have rewritten
+    return check_bundle(request, build_result, result["component_code"], result, trace), build_result
+
+# Function to send a failing component back to the model with its error until it builds.
+# Stops after request.repair_attempts attempts, or early when an error comes back unchanged.
+def repair_component(job, request, result, pool, client, builder, trace):
+    conversation = list(result["messages_internal"])
+    seen_errors = {error_signature(result["error_state"])}
+    attempts = []
+    for attempt in range(1, request.repair_attempts + 1):
+        job.update(f"Fixing the app automatically, attempt {attempt} of {request.repair_attempts}...")
+        error = trim_error(result["error_state"])
+        repair_message = {"role": "user", "content": REPAIR_PROMPT.format(error=error)}
+        record = {"attempt": attempt, "error": error, "ok": False}
+        attempts.append(record)
+        response = ""
+        try:
+            for delta in stream_completion(client, conversation + [repair_message],
+                                           trace=trace.bind(attempt=attempt), purpose="repair", deadline=job.deadline):
+                job.check_cancelled()
+                response += delta
+        except llm_requests.DeadlineExceeded:
+            # Keep the component as it is, the user can still ask for a fix
+            record["outcome"] = "deadline exceeded"
+            break
+        conversation += [repair_message, {"role": "assistant", "content": response}]
+
+        _, component_code, _ = generator.extract_component(response)
+        if not component_code:
+            record["outcome"] = "no component in response"
+            break
+        component_code, result["query_budget"] = budget_queries(pool, request.catalog, component_code, trace.bind(attempt=attempt))
+        with open(request.component_path, "w") as f:
+            f.write(component_code)
+        result["component_code"] = component_code
+        new_error, build_result = check_component(pool, builder, request, component_code, result, trace.bind(attempt=attempt))
+        result["build_result"] = build_result
+        if new_error is None:
+            record.update(ok=True, outcome="fixed")
+            result.update(error_state=None, show_open_app=True)
+            break
+        result["error_state"] = new_error
+        signature = error_signature(new_error)
+        if signature in seen_errors:
+            record["outcome"] = "error repeated"
+            break
+        seen_errors.add(signature)
+        record["outcome"] = "new error"
+
+    result["repair_attempts"] = attempts
+    result["messages_internal"] = conversation
+
+# Function to run one chat turn: assemble the prompt, generate the component, validate, build and summarize.
+# Runs on a job worker thread, so it must not touch Streamlit state; the outcome is returned as a dict.
+def run_generation(job, request, pool, client, builder):
+    result = {"error_state": None, "show_open_app": None, "build_result": None}
+    trace = (request.trace or telemetry.Trace("generation")).bind(job_id=job.id)
+    job.set_deadline(TURN_DEADLINE)
+
+    job.set_stage("prepare", "Preparing prompt...")
+    with trace.span("prompt_assembly") as attributes:
+        internal_prompt = build_internal_prompt(pool, request)
+        # Keep the latest turns verbatim and fold older ones into a rolling summary
+        messages, token_counts, context_state = context_builder.build_messages(
+            generator.generator_prompt, request.history, internal_prompt, request.context_state)
+        attributes.update(token_counts)
+    result.update(token_counts=token_counts, context_state=context_state)
+
+    with open(request.component_path, "r") as f:
+        current_component = f.read()
+    fingerprint = request.catalog["fingerprint"] if request.catalog else None
+    cache_key = response_cache.cache_key(MODEL, messages, fingerprint, current_component)
+    cached = response_cache.get(cache_key) if request.use_response_cache else None
+
+    build_future = None
+    errors_app_dir = request.app_dir
+    if request.candidates > 1 and not cached:
+        job.set_stage("generate", f"Generating {request.candidates} candidates in parallel...")
+        candidate, finished = run_candidates(job, request, messages, pool, client, trace)
+        result["candidates"] = [
+            {"index": c["index"], "temperature": c["temperature"], "selected": c is candidate, "ok": _candidate_succeeded(c)}
+            for c in sorted(finished, key=lambda c: c["index"])
+        ]
+        # Error locations point into the scratch workspace the candidate was built in
+        errors_app_dir = candidate["app_dir"]
+        response = candidate["response"]
+        if candidate["component_code"] is not None:
+            result["component_code"] = candidate["component_code"]
+            result["query_budget"] = candidate["query_budget"]
+            # Promote the selected candidate into the session's workspace
+            with open(request.component_path, "w+") as f:
+                f.write(candidate["component_code"])
+            if candidate["query_errors"]:
+                result["error_state"] = component_sql.format_query_errors(candidate["query_errors"])
+                result["show_open_app"] = False
+            else:
+                result["build_result"] = candidate["build_result"]
+    else:
+        # Stream the response, the component is written and built as soon as it is complete
+        job.set_stage("generate", "Thinking...")
+        chunks = [cached["response"]] if cached else stream_completion(client, messages, trace=trace, deadline=job.deadline)
+        known_build = cached["build"] if cached else None
+
+        parser = generator.ComponentStreamParser()
+        component_written = False
+        parse_seconds = 0.0
+        for delta in chunks:
+            job.check_cancelled()
+            parse_started = time.perf_counter()
+            component_code = parser.feed(delta)
+            parse_seconds += time.perf_counter() - parse_started
+            if component_code and not component_written:
+                component_written = True
+                job.update("Component complete, checking query budget...")
+                component_code, result["query_budget"] = budget_queries(pool, request.catalog, component_code, trace)
+                result["component_code"] = component_code
+                # write to MyApp.jsx
+                with trace.span("write_component", chars=len(component_code)):
+                    with open(request.component_path, "w+") as f:
+                        f.write(component_code)
+                query_errors = []
+                if known_build is not None:
+                    # The outcome of building this exact component is already known
+                    result["build_result"] = known_build
+                elif component_sql.SQL_VALIDATION_ENABLED:
+                    job.set_stage("validate", "Component complete, validating queries...")
+                    with trace.span("validate") as attributes:
+                        query_errors = component_sql.validate_component(pool, component_code)
+                        attributes["query_errors"] = len(query_errors)
+                if query_errors:
+                    # Report invalid SQL like a build error, there is no point in building the app
+                    result["error_state"] = component_sql.format_query_errors(query_errors)
+                    result["show_open_app"] = False
+                elif known_build is None:
+                    if preaggregation.PREAGGREGATION_ENABLED:
+                        job.set_stage("preaggregate", "Materializing expensive queries...")
+                        with trace.span("preaggregate"):
+                            result["component_code"] = preaggregate_component(pool, request, component_code, result)
+                    build_future = builder.submit(request.component_path)
+                    job.set_stage("build", "Building app while the response finishes...")
+            elif parser.is_in_component:
+                job.update(f"Writing component... ({len(parser.text)} characters received)")
+        response = parser.text
+        # Time spent parsing the streamed chunks, i.e. component extraction
+        trace.record("extract_component", parse_seconds * 1000, chars=len(response), cached=bool(cached))
+
+    result["response"] = response
+    result["messages_internal"] = messages + [{"role": "assistant", "content": response}]
+    if not cached:
+        response_cache.put(cache_key, response)
+        # A skipped build (batch.py --no-build) says nothing about whether the component builds
+        if build_future is None and result["build_result"] is not None and not result["build_result"].get("skipped"):
+            response_cache.record_build(cache_key, result["build_result"])
+
+    if build_future is not None:
+        job.update("Building app...")
+        wait_started = time.perf_counter()
+        build_result = build_future.result()
+        # wait_ms is the part of the build that did not overlap with the streaming of the response
+        trace.record("build", build_result["duration_ms"], ok=build_result["ok"], cached=build_result.get("cached", False),
+                     wait_ms=round((time.perf_counter() - wait_started) * 1000, 1))
+        if not build_result.get("skipped"):
+            response_cache.record_build(cache_key, build_result)
+        result["build_result"] = build_result
+    if result["build_result"] is not None:
+        if result["build_result"]["ok"]:
+            # Show the "Open App" button when new code is written
+            result["show_open_app"] = True
+            result["error_state"] = check_bundle(request, result["build_result"], result["component_code"], result, trace)
+        else:
+            result["error_state"] = build_service.format_build_errors(result["build_result"], errors_app_dir)
+            print(result["error_state"])
+            result["show_open_app"] = False
+
+    if result["error_state"] and result.get("component_code") and request.repair_attempts > 0:
+        job.set_stage("repair", "Fixing the app automatically...")
+        with trace.span("repair") as attributes:
+            repair_component(job, request, result, pool, client, builder, trace)
+            attributes.update(attempts=len(result["repair_attempts"]), fixed=result["error_state"] is None)
+
+    if result.get("component_code"):
+        # The component as it is on disk, after query rewrites and repairs
+        with open(request.component_path, "r") as f:
+            result["version"] = component_history.record_version(request.app_dir, f.read(), request.prompt, ok=result["error_state"] is None)
+
+    job.set_stage("summarize", "Summarizing changes...")
+    _, _, summary = generator.extract_component(response)
+    if not summary:
+        # Fall back to a second request if the response has no summary section
+        summary = ""
+        try:
+            for delta in stream_completion(client, [
+                {"role": "user", "content": request.prompt},
+                {"role": "assistant", "content": response},
+                {"role": "user", "content": "Summarize the changes you have done in one sentence"}
+            ], timeout=60, trace=trace, purpose="summary", deadline=job.deadline):
+                job.check_cancelled()
+                summary += delta
+        except llm_requests.DeadlineExceeded:
+            summary = "The app was updated, there was no time left to summarize the changes."
+    result["summary"] = summary
+    result["trace_id"] = trace.trace_id
+    return result
+
+# Function to bring back an earlier version of the component of a workspace, without the model and usually
+# without a build. Runs as a job, so the build of a version that was never built does not block the UI.
+def run_restore(job, app_dir, version, builder):
+    job.set_stage("restore", f"Restoring version {version['hash'][:8]}...")
+    # The last cancellation point: once the component is written back, it is built and recorded
+    job.set_stage("build", "Building the restored version...")
+    component_code = component_history.rollback(app_dir, version["hash"])
+    build_result = builder.build(os.path.join(app_dir, component_history.COMPONENT_FILE))
+    component_history.record_version(app_dir, component_code, version["prompt"], ok=build_result["ok"])
+    bundle = None
+    if build_result["ok"] and build_result.get("dist_dir"):
+        bundle = bundle_budget.record_build(app_dir, build_result["dist_dir"], version["hash"])
+    outcome = "build reused" if build_result.get("cached") else f"built in {build_result['duration_ms'] / 1000:.1f}s"
+    return {
+        "error_state": None if build_result["ok"] else build_service.format_build_errors(build_result, app_dir),
+        "show_open_app": build_result["ok"],
+        "bundle": bundle,
+        "summary": f"_Restored version {version['hash'][:8]} ({outcome})._",
+    }
@@ -0,0 +1,142 @@
+import argparse
+import hashlib
+import json
+import os
+import threading
+import time
+
+import duckdb
+
+import atomic_files
+import component_sql
+from schema_stats import quote_identifier
+
+PREAGGREGATION_ENABLED = os.getenv('PREAGGREGATION', '0') == '1'
+PREAGGREGATION_SCHEMA = os.getenv('PREAGGREGATION_SCHEMA', 'app_preaggregations')
+# Aggregations scanning fewer estimated rows than this run fast enough in the browser
+PREAGGREGATION_MIN_SCAN_ROWS = int(os.getenv('PREAGGREGATION_MIN_SCAN_ROWS', '1000000'))
+# Results larger than this are not worth shipping as a table, the original query is kept
+PREAGGREGATION_MAX_ROWS = int(os.getenv('PREAGGREGATION_MAX_ROWS', '10000'))
+PREAGGREGATION_MANIFEST = os.getenv('PREAGGREGATION_MANIFEST', '.cache/preaggregations.json')
+
+_lock = threading.Lock()
+
+def load_manifest():
+    try:
+        with open(PREAGGREGATION_MANIFEST, "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def _save_manifest(manifest):
+    # Jobs and the refresh CLI may save the manifest at the same time
+    atomic_files.write_json(PREAGGREGATION_MANIFEST, manifest, indent=2)
+
+def table_name(sql):
+    normalized = " ".join(sql.split()).rstrip(";").lower()
+    return "agg_" + hashlib.sha256(normalized.encode()).hexdigest()[:12]
+
+def qualified_table(database_name, name):
+    return ".".join(quote_identifier(part) for part in (database_name, PREAGGREGATION_SCHEMA, name))
+
+# Function to estimate the cost of a query from its plan: the largest estimated cardinality, which for
+# an aggregation is the number of rows it scans. Returns None for queries that do not aggregate.
+def estimate_scan_rows(cursor, sql):
+    plan = component_sql.explain_plan(cursor, sql)
+    if not component_sql.AGGREGATE_OPERATOR_PATTERN.search(plan):
+        return None
+    return max(component_sql.plan_estimates(plan), default=0)
+
+def _create_table(cursor, database_name, name, sql):
+    cursor.execute(f"CREATE SCHEMA IF NOT EXISTS {quote_identifier(database_name)}.{quote_identifier(PREAGGREGATION_SCHEMA)}")
+    # Insertion order is preserved, so reading the table back without ORDER BY keeps the query's order
+    cursor.execute(f"CREATE OR REPLACE TABLE {qualified_table(database_name, name)} AS {sql}")
+    return cursor.execute(f"SELECT count(*) FROM {qualified_table(database_name, name)}").fetchone()[0]
+
+# Function to materialize one expensive static aggregation, returns its manifest entry or None
+def materialize_query(pool, database_name, sql, manifest):
+    sql = sql.strip().rstrip(";")
+    name = table_name(sql)
+    key = f"{database_name}.{PREAGGREGATION_SCHEMA}.{name}"
+    if key in manifest:
+        return manifest[key]
+    with pool.cursor() as cursor:
+        try:
+            scan_rows = estimate_scan_rows(cursor, sql)
+            if scan_rows is None or scan_rows < PREAGGREGATION_MIN_SCAN_ROWS:
+                return None
+            rows = _create_table(cursor, database_name, name, sql)
+            if rows > PREAGGREGATION_MAX_ROWS:
+                cursor.execute(f"DROP TABLE {qualified_table(database_name, name)}")
+                return None
+        except duckdb.Error as e:
+            # e.g. a read-only share, the component keeps the original query
+            print(f"Could not materialize query: {e}")
+            return None
+    now = time.time()
+    return {"database": database_name, "schema": PREAGGREGATION_SCHEMA, "table": name, "sql": sql,
+            "estimated_scan_rows": scan_rows, "rows": rows, "created_at": now, "refreshed_at": now}
+
+def _rewritten_query(database_name, entry, quote_char):
+    # The original query is kept as a comment, for the model and for anyone reading the component
+    original = entry["sql"].replace("*/", "* /")
+    sql = f"SELECT * FROM {qualified_table(database_name, entry['table'])} /* pre-aggregated from: {original} */"
+    return component_sql.encode_literal(sql, quote_char)
+
+# Function to replace the expensive static aggregations of a component with reads from summary tables.
+# Returns the rewritten component and the manifest entries of the tables it reads.
+def apply_preaggregations(pool, database_name, component_code):
+    queries = [query for query in component_sql.extract_queries(component_code)
+               if not query.placeholders and PREAGGREGATION_SCHEMA not in query.sql]
+    if not queries or not database_name:
+        return component_code, []
+    with _lock:
+        manifest = load_manifest()
+    entries = [materialize_query(pool, database_name, query.text, manifest) for query in queries]
+
+    materialized = []
+    # Replace from the end so the offsets of earlier queries stay valid
+    for query, entry in sorted(zip(queries, entries), key=lambda pair: pair[0].start, reverse=True):
+        if entry is None:
+            continue
+        component_code = component_code[:query.start] + _rewritten_query(database_name, entry, component_code[query.start - 1]) + component_code[query.end:]
+        materialized.append(entry)
+    if materialized:
+        with _lock:
+            manifest = load_manifest()
+            manifest.update({f"{e['database']}.{e['schema']}.{e['table']}": e for e in materialized})
+            _save_manifest(manifest)
+    return component_code, materialized
+
+# Function to recompute the summary tables of the manifest from their source queries
+def refresh(conn, database_name=None):
+    with _lock:
+        manifest = load_manifest()
+    refreshed = []
+    for key, entry in manifest.items():
+        if database_name is not None and entry["database"] != database_name:
+            continue
+        try:
+            entry["rows"] = _create_table(conn, entry["database"], entry["table"], entry["sql"])
+            entry["refreshed_at"] = time.time()
+            refreshed.append(key)
+        except duckdb.Error as e:
+            print(f"Could not refresh {key}: {e}")
+    with _lock:
+        current = load_manifest()
+        current.update({key: manifest[key] for key in refreshed})
+        _save_manifest(current)
+    return refreshed
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Refresh the pre-aggregated summary tables read by generated apps")
+    parser.add_argument("command", choices=["refresh", "list"])
+    parser.add_argument("--database", help="only refresh the tables of this database")
+    args = parser.parse_args()
+    if args.command == "list":
+        for key, entry in load_manifest().items():
+            print(f"{key}\t{entry['rows']} rows\trefreshed {time.ctime(entry['refreshed_at'])}")
+    else:
+        conn = duckdb.connect(database=os.getenv('MOTHERDUCK_DATABASE', 'md:'), read_only=False)
+        for key in refresh(conn, args.database):
+            print(f"Refreshed {key}")
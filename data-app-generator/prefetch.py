@@ -0,0 +1,100 @@
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import duckdb
+
+import atomic_files
+import connection_pool
+import schema_cache
+import schema_index
+
+PREFETCH_WORKERS = int(os.getenv('PREFETCH_WORKERS', '4'))
+# Number of databases whose schema is loaded at startup, the most recently used ones first
+PREFETCH_DATABASES = int(os.getenv('PREFETCH_DATABASES', '5'))
+RECENT_DATABASES_FILE = os.getenv('RECENT_DATABASES_FILE', '.cache/recent_databases.json')
+MAX_RECENT_DATABASES = 20
+
+def load_recent_databases():
+    try:
+        with open(RECENT_DATABASES_FILE, "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return []
+
+# Function to move a database to the front of the most recently used list
+def record_database_use(database_name):
+    recent = [database_name] + [name for name in load_recent_databases() if name != database_name]
+    atomic_files.write_json(RECENT_DATABASES_FILE, recent[:MAX_RECENT_DATABASES])
+
+def _list_databases(pool):
+    with pool.cursor() as cursor:
+        try:
+            result = cursor.execute("SHOW ALL DATABASES").fetchall()
+        except duckdb.ParserException:
+            # SHOW ALL DATABASES is MotherDuck specific
+            result = cursor.execute("SELECT database_name FROM duckdb_databases() WHERE NOT internal").fetchall()
+    return [db[0] for db in result]
+
+def _load_catalog(pool, database_name):
+    with pool.cursor() as cursor:
+        catalog = schema_cache.get_catalog(cursor, database_name)
+    # Build the search index as well, so the first prompt does not wait for it
+    schema_index.get_index(catalog)
+    return catalog
+
+# Warms the connection, the database list and the schemas of the most recently used databases on a
+# bounded worker pool, so the UI renders at once and the first selection finds its schema loaded
+class CatalogPrefetcher:
+    def __init__(self, connect, workers=PREFETCH_WORKERS, max_databases=PREFETCH_DATABASES):
+        self.max_databases = max_databases
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="prefetch")
+        self._lock = threading.Lock()
+        self._catalogs = {}
+        self._pool_future = self._executor.submit(lambda: connection_pool.CursorPool(connect()))
+        self._databases_future = self._executor.submit(self._load_databases)
+
+    def _load_databases(self):
+        databases = _list_databases(self.pool())
+        recent = [name for name in load_recent_databases() if name in databases]
+        for database_name in (recent + [name for name in databases if name not in recent])[:self.max_databases]:
+            self.catalog_future(database_name)
+        return databases
+
+    # Function to return the cursor pool, waiting for the connection if it is still being opened
+    def pool(self):
+        return self._pool_future.result()
+
+    # Function to return the cursor pool if the connection is open, None while it is being opened.
+    # Raises the error of the connection if it failed.
+    def pool_if_ready(self):
+        return self._pool_future.result() if self._pool_future.done() else None
+
+    # Whether the connection or the list of databases failed, the futures keep their error
+    @property
+    def failed(self):
+        return any(future.done() and future.exception() is not None for future in (self._pool_future, self._databases_future))
+
+    def close(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def databases(self, timeout=None):
+        return self._databases_future.result(timeout)
+
+    def catalog_future(self, database_name):
+        with self._lock:
+            if database_name not in self._catalogs:
+                self._catalogs[database_name] = self._executor.submit(lambda: _load_catalog(self.pool(), database_name))
+            return self._catalogs[database_name]
+
+    # Function to return the catalog of a database, prefetched if possible. A prefetched catalog is only
+    # handed out once, later calls load it again, which is cheap while its fingerprint is unchanged.
+    def get_catalog(self, database_name):
+        future = self.catalog_future(database_name)
+        try:
+            return future.result()
+        finally:
+            with self._lock:
+                if self._catalogs.get(database_name) is future:
+                    del self._catalogs[database_name]
@@ -0,0 +1,176 @@
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+
+import duckdb
+
+import component_sql
+
+QUERY_BUDGET_ENABLED = os.getenv('QUERY_BUDGET', '1') == '1'
+# Rows a query may ship to the browser, larger results are capped or sampled
+QUERY_BUDGET_MAX_ROWS = int(os.getenv('QUERY_BUDGET_MAX_ROWS', '5000'))
+# Estimated data a query may scan on MotherDuck, raw-row queries above it are sampled at the table
+QUERY_BUDGET_MAX_SCAN_MB = float(os.getenv('QUERY_BUDGET_MAX_SCAN_MB', '1024'))
+
+LIMIT_OPERATOR_PATTERN = re.compile(r'\b(STREAMING_LIMIT|LIMIT|TOP_N)\b')
+TRAILING_LIMIT_PATTERN = re.compile(r'\bLIMIT\s+(\d+)(\s+OFFSET\s+\d+)?\s*;?\s*$', re.IGNORECASE)
+ORDER_BY_PATTERN = re.compile(r'\bORDER\s+BY\b', re.IGNORECASE)
+SAMPLE_PATTERN = re.compile(r'\b(USING\s+SAMPLE|TABLESAMPLE)\b', re.IGNORECASE)
+JOIN_PATTERN = re.compile(r'\bJOIN\b', re.IGNORECASE)
+STAR_PATTERN = re.compile(r'(\bSELECT\s+(DISTINCT\s+)?|\.|,)\s*\*', re.IGNORECASE)
+# A table reference with an optional alias; the alias must not be the keyword of the next clause
+TABLE_REFERENCE_PATTERN = re.compile(
+    r'\bFROM\s+((?:"[^"]+"|\w+)(?:\.(?:"[^"]+"|\w+)){0,2})'
+    r'(\s+(?:AS\s+)?(?!(?:WHERE|GROUP|ORDER|LIMIT|OFFSET|HAVING|QUALIFY|WINDOW|UNION|EXCEPT|INTERSECT|USING|'
+    r'JOIN|LEFT|RIGHT|INNER|OUTER|FULL|CROSS|NATURAL|POSITIONAL|ASOF|SEMI|ANTI|TABLESAMPLE)\b)\w+)?',
+    re.IGNORECASE)
+
+# Approximate bytes per value; variable width types get an average
+TYPE_WIDTHS = {
+    "BOOLEAN": 1, "TINYINT": 1, "UTINYINT": 1, "SMALLINT": 2, "USMALLINT": 2, "INTEGER": 4, "UINTEGER": 4,
+    "BIGINT": 8, "UBIGINT": 8, "HUGEINT": 16, "UHUGEINT": 16, "FLOAT": 4, "DOUBLE": 8, "DECIMAL": 8,
+    "DATE": 4, "TIME": 8, "TIMESTAMP": 8, "INTERVAL": 16, "UUID": 16, "VARCHAR": 32, "BLOB": 64,
+}
+DEFAULT_TYPE_WIDTH = 16
+NESTED_TYPE_WIDTH = 64
+DEFAULT_ROW_WIDTH = 64
+
+def _type_width(column_type):
+    if column_type.endswith("]") or column_type.startswith(("STRUCT", "MAP", "UNION")):
+        return NESTED_TYPE_WIDTH
+    return TYPE_WIDTHS.get(re.match(r'[A-Z]*', column_type.upper()).group(0), DEFAULT_TYPE_WIDTH)
+
+# Function to estimate the width of the rows a query reads: the columns of the catalog's tables it names,
+# all of them for SELECT *
+def estimate_row_width(sql, catalog):
+    if not catalog:
+        return DEFAULT_ROW_WIDTH
+    select_all = bool(STAR_PATTERN.search(sql))
+    width = 0
+    for key, table in catalog["tables"].items():
+        if not re.search(rf'\b{re.escape(key.split(".")[-1])}\b', sql, re.IGNORECASE):
+            continue
+        for column in table["columns"]:
+            if select_all or re.search(rf'\b{re.escape(column["name"])}\b', sql, re.IGNORECASE):
+                width += _type_width(column["type"])
+    return width or DEFAULT_ROW_WIDTH
+
+# Function to estimate what a query returns and scans from its plan. The output is the topmost estimate,
+# capped by a trailing LIMIT; it is unknown for aggregations on DuckDB versions that only estimate scans,
+# joins and filters. The scan is the largest estimate, which is the largest input of the plan.
+def analyze_query(cursor, sql, catalog=None):
+    plan = component_sql.explain_plan(cursor, sql)
+    estimates = component_sql.plan_estimates(plan)
+    aggregated = bool(component_sql.AGGREGATE_OPERATOR_PATTERN.search(plan))
+    estimated_rows = estimates[0] if estimates else None
+    if aggregated and "EC:" in plan:
+        estimated_rows = None
+    scan_rows = max(estimates, default=0)
+    limit = TRAILING_LIMIT_PATTERN.search(sql)
+    limit_operator = LIMIT_OPERATOR_PATTERN.search(plan)
+    if limit and limit_operator:
+        limit_rows = int(limit.group(1))
+        estimated_rows = min(limit_rows, estimated_rows if estimated_rows is not None else limit_rows)
+        if limit_operator.group(1) != "TOP_N" and not aggregated:
+            # A limit without ORDER BY stops the scan once it has its rows
+            scan_rows = min(scan_rows, limit_rows)
+    row_width = estimate_row_width(sql, catalog)
+    return {
+        "aggregated": aggregated,
+        "estimated_rows": estimated_rows,
+        "scan_rows": scan_rows,
+        "row_width": row_width,
+        "estimated_scan_mb": round(scan_rows * row_width / 1024 ** 2, 1),
+    }
+
+def _wrap(sql, clause):
+    body = sql.rstrip()
+    trailing = sql[len(body):]
+    return f"SELECT * FROM ({body.rstrip(';')}) AS budgeted {clause}{trailing}"
+
+# Function to sample the only table of a query at the given percentage, returns None if the query reads
+# more than one table or a subquery
+def _sample_table(sql, percentage):
+    references = list(TABLE_REFERENCE_PATTERN.finditer(sql))
+    if len(references) != 1 or JOIN_PATTERN.search(sql) or sql[references[0].end():].lstrip().startswith(","):
+        return None
+    end = references[0].end()
+    return f"{sql[:end]} TABLESAMPLE {percentage:.2g}% (system){sql[end:]}"
+
+# Function to rewrite a query over budget: raw-row queries scanning too much read a sample of their table,
+# results with too many rows keep the first rows of an ordered query or a sample of an unordered one.
+# Aggregations are not rewritten, sampling would change their results. Returns the query and the action.
+def rewrite_query(sql, analysis, max_rows, max_scan_mb):
+    if analysis["aggregated"] or SAMPLE_PATTERN.search(sql):
+        return sql, None
+    actions = []
+    estimated_rows = analysis["estimated_rows"]
+    ordered = bool(ORDER_BY_PATTERN.search(sql))
+    if analysis["estimated_scan_mb"] > max_scan_mb and not ordered:
+        percentage = max(0.01, 100 * max_scan_mb / analysis["estimated_scan_mb"])
+        sampled = _sample_table(sql, percentage)
+        if sampled is not None:
+            sql = sampled
+            actions.append("sampled table")
+            if estimated_rows is not None:
+                estimated_rows = estimated_rows * percentage / 100
+    if estimated_rows is not None and estimated_rows > max_rows:
+        if ordered:
+            sql = _wrap(sql, f"/* capped at the row budget */ LIMIT {max_rows}")
+            actions.append("limited")
+        else:
+            sql = _wrap(sql, f"/* sampled to the row budget */ USING SAMPLE {max_rows} ROWS")
+            actions.append("sampled rows")
+    return sql, ", ".join(actions) or None
+
+def _plans(cursor, sql):
+    try:
+        component_sql.explain_plan(cursor, sql.strip().rstrip(';'))
+        return True
+    except duckdb.Error:
+        return False
+
+def _check_query(pool, query, catalog):
+    candidates = component_sql.substitution_candidates(query.sql)
+    if candidates is None:
+        return None
+    with pool.cursor() as cursor:
+        # Like the SQL validation, the query is analyzed with the first way of filling its placeholders that plans
+        analysis = None
+        for candidate in candidates:
+            try:
+                analysis = analyze_query(cursor, candidate.strip().rstrip(';'), catalog)
+                break
+            except duckdb.Error:
+                continue
+        if analysis is None:
+            # Invalid queries are reported by the SQL validation
+            return None
+        over_rows = analysis["estimated_rows"] is not None and analysis["estimated_rows"] > QUERY_BUDGET_MAX_ROWS
+        over_scan = analysis["estimated_scan_mb"] > QUERY_BUDGET_MAX_SCAN_MB
+        if not over_rows and not over_scan:
+            return None
+        finding = {"line": query.line, "sql": query.sql.strip(), "estimated_rows": analysis["estimated_rows"],
+                   "estimated_scan_mb": analysis["estimated_scan_mb"], "action": "flagged", "rewritten_sql": None}
+        rewritten, action = rewrite_query(query.sql, analysis, QUERY_BUDGET_MAX_ROWS, QUERY_BUDGET_MAX_SCAN_MB)
+        if action is None:
+            return finding
+        # Keep the rewrite only if it still plans with one of the ways of filling its placeholders
+        if not any(_plans(cursor, candidate) for candidate in component_sql.substitution_candidates(rewritten)):
+            return finding
+        finding.update(action=action, rewritten_sql=rewritten)
+        return finding
+
+# Function to check the queries of a component against the row and scan budget before it is written.
+# Returns the component with over-budget queries rewritten and one finding per over-budget query.
+def enforce_budget(pool, component_code, catalog=None):
+    queries = component_sql.extract_queries(component_code)
+    if not queries:
+        return component_code, []
+    with ThreadPoolExecutor(max_workers=component_sql.SQL_VALIDATION_WORKERS) as executor:
+        findings = list(executor.map(lambda query: _check_query(pool, query, catalog), queries))
+    # Replace from the end so the offsets of earlier queries stay valid
+    for query, finding in sorted(zip(queries, findings), key=lambda pair: pair[0].start, reverse=True):
+        if finding is not None and finding["rewritten_sql"] is not None:
+            component_code = component_code[:query.start] + finding["rewritten_sql"] + component_code[query.end:]
+    return component_code, [finding for finding in findings if finding is not None]
@@ -0,0 +1,82 @@
+import hashlib
+import json
+import os
+import threading
+import time
+
+import atomic_files
+
+RESPONSE_CACHE_ENABLED = os.getenv('RESPONSE_CACHE', '1') == '1'
+RESPONSE_CACHE_DIR = os.getenv('RESPONSE_CACHE_DIR', '.cache/responses')
+RESPONSE_CACHE_MAX_BYTES = int(os.getenv('RESPONSE_CACHE_MAX_MB', '50')) * 1024 * 1024
+
+_lock = threading.Lock()
+
+# Function to compute the content address of a generation request
+def cache_key(model, messages, schema_fingerprint, component_code):
+    payload = json.dumps({
+        "model": model,
+        "messages": [{"role": m["role"], "content": m["content"]} for m in messages],
+        "schema_fingerprint": schema_fingerprint,
+        "component": component_code,
+    }, sort_keys=True)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+def _entry_path(key):
+    return os.path.join(RESPONSE_CACHE_DIR, f"{key}.json")
+
+def _write_entry(key, entry):
+    atomic_files.write_json(_entry_path(key), entry)
+
+# Function to return the cached entry ({"response", "build"}) for a key, or None
+def get(key):
+    path = _entry_path(key)
+    try:
+        with open(path, "r") as f:
+            entry = json.load(f)
+    except (OSError, ValueError):
+        return None
+    # The modification time is the last access time used for LRU eviction
+    try:
+        os.utime(path)
+    except OSError:
+        # Evicted since it was read
+        pass
+    return entry
+
+def put(key, response):
+    with _lock:
+        _write_entry(key, {"response": response, "build": None, "created_at": time.time()})
+        evict()
+
+# Function to remember the build outcome of the component contained in a cached response
+def record_build(key, build_result):
+    with _lock:
+        entry = get(key)
+        if entry is None:
+            return
+        entry["build"] = {"ok": build_result["ok"], "errors": build_result["errors"], "duration_ms": build_result["duration_ms"]}
+        _write_entry(key, entry)
+
+# Function to remove the least recently used entries until the cache fits its size limit
+def evict(max_bytes=RESPONSE_CACHE_MAX_BYTES):
+    try:
+        names = [name for name in os.listdir(RESPONSE_CACHE_DIR) if name.endswith(".json")]
+    except OSError:
+        return
+    entries = []
+    for name in names:
+        try:
+            stat = os.stat(os.path.join(RESPONSE_CACHE_DIR, name))
+        except OSError:
+            continue
+        entries.append((stat.st_mtime, stat.st_size, name))
+    total_bytes = sum(size for _, size, _ in entries)
+    for _, size, name in sorted(entries):
+        if total_bytes <= max_bytes:
+            break
+        try:
+            os.remove(os.path.join(RESPONSE_CACHE_DIR, name))
+        except OSError:
+            pass
+        total_bytes -= size
@@ -0,0 +1,93 @@
+import hashlib
+import json
+import os
+import re
+
+import atomic_files
+
+SCHEMA_CACHE_DIR = os.getenv('SCHEMA_CACHE_DIR', '.cache/schema')
+CATALOG_VERSION = 3
+
+# Cheap per-table fingerprint: one row per table with its column count and a hash of the column metadata
+FINGERPRINT_QUERY = """
+SELECT c.schema_name, c.table_name, count(*) AS column_count,
+       md5(coalesce(any_value(t.comment), '') || '|' ||
+           string_agg(c.column_name || ':' || c.data_type || ':' || coalesce(c.comment, ''), ',' ORDER BY c.column_index)) AS columns_hash
+FROM duckdb_columns() c
+JOIN duckdb_tables() t USING (database_name, schema_name, table_name)
+WHERE c.database_name = ?
+GROUP BY c.schema_name, c.table_name
+"""
+
+TABLES_QUERY = """
+SELECT t.schema_name, t.table_name, any_value(t.sql), any_value(t.comment),
+       list(c.column_name ORDER BY c.column_index), list(c.data_type ORDER BY c.column_index),
+       list(c.comment ORDER BY c.column_index)
+FROM duckdb_tables() t
+JOIN duckdb_columns() c USING (database_name, schema_name, table_name)
+WHERE t.database_name = ? AND list_contains(?, t.schema_name || '.' || t.table_name)
+GROUP BY t.schema_name, t.table_name
+"""
+
+def _cache_path(database_name):
+    safe_name = re.sub(r'[^A-Za-z0-9_.-]', '_', database_name)
+    return os.path.join(SCHEMA_CACHE_DIR, f"{safe_name}.json")
+
+def load_catalog(database_name):
+    try:
+        with open(_cache_path(database_name), "r") as f:
+            catalog = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if catalog.get("database") != database_name or catalog.get("version") != CATALOG_VERSION:
+        return None
+    return catalog
+
+def save_catalog(catalog):
+    atomic_files.write_json(_cache_path(catalog["database"]), catalog)
+
+# Function to compute the fingerprint of a database from its column metadata
+def fetch_fingerprint(conn, database_name):
+    rows = conn.execute(FINGERPRINT_QUERY, [database_name]).fetchall()
+    table_hashes = {f"{schema}.{table}": columns_hash for schema, table, _, columns_hash in rows}
+    digest = hashlib.sha256()
+    for key in sorted(table_hashes):
+        digest.update(f"{key}={table_hashes[key]};".encode())
+    fingerprint = {
+        "table_count": len(rows),
+        "column_count": sum(row[2] for row in rows),
+        "columns_hash": digest.hexdigest(),
+    }
+    return fingerprint, table_hashes
+
+# Function to return the cached catalog of a database, re-fetching only the tables whose fingerprint changed
+def get_catalog(conn, database_name):
+    fingerprint, table_hashes = fetch_fingerprint(conn, database_name)
+    catalog = load_catalog(database_name) or {"fingerprint": None, "tables": {}}
+    if catalog["fingerprint"] == fingerprint:
+        return catalog
+
+    cached_tables = catalog["tables"]
+    tables = {key: cached_tables[key] for key, columns_hash in table_hashes.items()
+              if key in cached_tables and cached_tables[key]["hash"] == columns_hash}
+    changed = [key for key in table_hashes if key not in tables]
+    if changed:
+        rows = conn.execute(TABLES_QUERY, [database_name, changed]).fetchall()
+        for schema, table, sql, comment, column_names, column_types, column_comments in rows:
+            key = f"{schema}.{table}"
+            tables[key] = {
+                "hash": table_hashes[key],
+                "sql": sql,
+                "comment": comment,
+                "columns": [{"name": name, "type": column_type, "comment": column_comment}
+                            for name, column_type, column_comment in zip(column_names, column_types, column_comments)],
+            }
+
+    catalog = {"version": CATALOG_VERSION, "database": database_name, "fingerprint": fingerprint, "tables": tables}
+    save_catalog(catalog)
+    return catalog
+
+def render_schema(catalog, table_keys=None):
+    if table_keys is None:
+        table_keys = sorted(catalog["tables"])
+    return "\n".join(catalog["tables"][key]["sql"] for key in table_keys)
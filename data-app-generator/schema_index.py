@@ -0,0 +1,111 @@
+import math
+import os
+import re
+from collections import Counter
+
+import schema_cache
+
+SCHEMA_TOKEN_BUDGET = int(os.getenv('SCHEMA_TOKEN_BUDGET', '6000'))
+SCHEMA_TOP_K = int(os.getenv('SCHEMA_TOP_K', '12'))
+
+# BM25 parameters
+K1 = 1.2
+B = 0.75
+# Table and schema names count more than column names and comments
+NAME_WEIGHT = 3
+
+_indexes = {}
+
+# Rough token estimate (~4 characters per token), good enough for budgeting prompt sections
+def estimate_tokens(text):
+    return (len(text) + 3) // 4
+
+def tokenize(text):
+    if not text:
+        return []
+    # Split snake_case, camelCase and punctuation, then drop a plural "s" so "orders" matches "order"
+    text = re.sub(r'([a-z0-9])([A-Z])', r'\1 \2', text)
+    tokens = []
+    for token in re.findall(r'[A-Za-z0-9]+', text.lower()):
+        if len(token) > 3 and token.endswith('s') and not token.endswith('ss'):
+            token = token[:-1]
+        tokens.append(token)
+    return tokens
+
+def _table_terms(key, table):
+    terms = tokenize(key) * NAME_WEIGHT
+    terms += tokenize(table.get("comment"))
+    for column in table.get("columns", []):
+        terms += tokenize(column["name"])
+        terms += tokenize(column["comment"])
+    return terms
+
+class SchemaIndex:
+    def __init__(self, catalog):
+        self.keys = sorted(catalog["tables"])
+        self.term_counts = [Counter(_table_terms(key, catalog["tables"][key])) for key in self.keys]
+        self.lengths = [sum(counts.values()) for counts in self.term_counts]
+        self.avg_length = sum(self.lengths) / len(self.lengths) if self.lengths else 0
+        document_frequency = Counter(term for counts in self.term_counts for term in counts)
+        n = len(self.keys)
+        self.idf = {term: math.log(1 + (n - df + 0.5) / (df + 0.5)) for term, df in document_frequency.items()}
+
+    # Function to rank tables by BM25 relevance to a free text query, best first
+    def search(self, query, k=SCHEMA_TOP_K):
+        query_terms = set(tokenize(query))
+        scores = []
+        for key, counts, length in zip(self.keys, self.term_counts, self.lengths):
+            score = 0.0
+            for term in query_terms:
+                tf = counts.get(term)
+                if tf:
+                    norm = K1 * (1 - B + B * length / self.avg_length)
+                    score += self.idf[term] * tf * (K1 + 1) / (tf + norm)
+            if score > 0:
+                scores.append((score, key))
+        scores.sort(key=lambda item: (-item[0], item[1]))
+        return [key for _, key in scores[:k]]
+
+def get_index(catalog):
+    cache_key = (catalog["database"], catalog["fingerprint"]["columns_hash"])
+    if cache_key not in _indexes:
+        _indexes[cache_key] = SchemaIndex(catalog)
+    return _indexes[cache_key]
+
+# Function to pick the tables for the schema section of the prompt, most relevant first.
+# All tables are kept when the full schema fits the budget; otherwise tables already used by
+# the app and the top-k tables for the instruction are kept as far as the budget allows.
+def select_tables(catalog, instruction, app_code="", token_budget=SCHEMA_TOKEN_BUDGET, top_k=SCHEMA_TOP_K):
+    if catalog is None:
+        return []
+    tables = catalog["tables"]
+    pinned = [key for key in sorted(tables)
+              if app_code and re.search(rf'\b{re.escape(key.split(".", 1)[1])}\b', app_code)]
+    ranked = [key for key in get_index(catalog).search(instruction, top_k) if key not in pinned]
+    rest = [key for key in sorted(tables) if key not in pinned and key not in ranked]
+    if estimate_tokens(schema_cache.render_schema(catalog)) <= token_budget:
+        return pinned + ranked + rest
+
+    # Nothing relevant found: fall back to the full schema, cut to the budget
+    candidates = pinned + ranked if pinned or ranked else rest
+    selected = []
+    used_tokens = 0
+    for key in candidates:
+        table_tokens = estimate_tokens(tables[key]["sql"]) + 1
+        if used_tokens + table_tokens > token_budget:
+            continue
+        selected.append(key)
+        used_tokens += table_tokens
+    return selected
+
+# Function to render the selected tables, listing the remaining tables by name if the budget allows
+def render_selection(catalog, selected, token_budget=SCHEMA_TOKEN_BUDGET):
+    if catalog is None:
+        return ""
+    schema = schema_cache.render_schema(catalog, sorted(selected))
+    omitted = [key for key in sorted(catalog["tables"]) if key not in selected]
+    if omitted:
+        omitted_line = f"\n-- Other tables (columns not shown): {', '.join(omitted)}"
+        if estimate_tokens(schema + omitted_line) <= token_budget:
+            schema += omitted_line
+    return schema
@@ -0,0 +1,146 @@
+import json
+import os
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import atomic_files
+
+SCHEMA_STATS_ENABLED = os.getenv('SCHEMA_STATS', '0') == '1'
+SCHEMA_STATS_DIR = os.getenv('SCHEMA_STATS_DIR', '.cache/stats')
+SCHEMA_STATS_TTL = int(os.getenv('SCHEMA_STATS_TTL', '3600'))
+SCHEMA_STATS_WORKERS = int(os.getenv('SCHEMA_STATS_WORKERS', '4'))
+SCHEMA_STATS_MAX_TABLES = int(os.getenv('SCHEMA_STATS_MAX_TABLES', '10'))
+SCHEMA_STATS_SAMPLE_ROWS = int(os.getenv('SCHEMA_STATS_SAMPLE_ROWS', '100000'))
+
+MAX_COLUMNS = 20
+# Text columns with at most this many distinct values get sample values
+CATEGORICAL_MAX_DISTINCT = 50
+SAMPLE_VALUES = 5
+SAMPLE_ROWS = 10000
+
+ORDERABLE_TYPE = re.compile(r'^(U?(TINY|SMALL|BIG|HUGE)?INT(EGER)?|FLOAT|DOUBLE|REAL|DECIMAL.*|DATE|TIME.*|TIMESTAMP.*)$')
+# Row count DuckDB keeps for every table, so statistics need no count(*) over the whole table
+ESTIMATED_ROWS_QUERY = """
+SELECT estimated_size FROM duckdb_tables()
+WHERE database_name = ? AND schema_name = ? AND table_name = ?
+"""
+
+SCALAR_TYPE = re.compile(r'^(BOOLEAN|VARCHAR|UUID|U?(TINY|SMALL|BIG|HUGE)?INT(EGER)?|FLOAT|DOUBLE|REAL|DECIMAL.*|DATE|TIME.*|TIMESTAMP.*)$')
+
+def quote_identifier(name):
+    return '"' + name.replace('"', '""') + '"'
+
+def qualified_name(database_name, table_key):
+    schema, table = table_key.split(".", 1)
+    return ".".join(quote_identifier(part) for part in (database_name, schema, table))
+
+def _cache_path(database_name):
+    safe_name = re.sub(r'[^A-Za-z0-9_.-]', '_', database_name)
+    return os.path.join(SCHEMA_STATS_DIR, f"{safe_name}.json")
+
+def _load_cache(database_name):
+    try:
+        with open(_cache_path(database_name), "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def _save_cache(database_name, cache):
+    # Concurrent sessions may save the statistics of the same database
+    atomic_files.write_json(_cache_path(database_name), cache)
+
+# Function to return the estimated row count of a table, or None for views
+def estimated_rows(cursor, database_name, table_key):
+    schema, table = table_key.split(".", 1)
+    row = cursor.execute(ESTIMATED_ROWS_QUERY, [database_name, schema, table]).fetchone()
+    return row[0] if row else None
+
+# Function to collect row count, distinct counts, min/max and sample values of one table. The row count is
+# DuckDB's estimate, and tables over SCHEMA_STATS_SAMPLE_ROWS rows are read from a system sample, which skips
+# whole vectors instead of scanning the table. Distinct counts and min/max of a sample are approximate.
+def fetch_table_stats(cursor, database_name, table_key, table):
+    table_name = qualified_name(database_name, table_key)
+    columns = [column for column in table["columns"] if SCALAR_TYPE.match(column["type"] or "")][:MAX_COLUMNS]
+
+    rows = estimated_rows(cursor, database_name, table_key)
+    sample = ""
+    if rows is not None and rows > SCHEMA_STATS_SAMPLE_ROWS:
+        sample = f" USING SAMPLE {100 * SCHEMA_STATS_SAMPLE_ROWS / rows:.6f}% (system)"
+    # Views have no estimate and are counted
+    expressions = ["count(*)"] if rows is None else []
+    for column in columns:
+        name = quote_identifier(column["name"])
+        expressions.append(f"approx_count_distinct({name})")
+        if column["type"] in ("FLOAT", "DOUBLE", "REAL"):
+            expressions += [f"round(min({name}), 4)::VARCHAR", f"round(max({name}), 4)::VARCHAR"]
+        elif ORDERABLE_TYPE.match(column["type"]):
+            expressions += [f"min({name})::VARCHAR", f"max({name})::VARCHAR"]
+    if not expressions:
+        return {"rows": rows, "sampled": False, "columns": {}}
+    row = cursor.execute(f"SELECT {', '.join(expressions)} FROM {table_name}{sample}").fetchone()
+
+    values = iter(row)
+    stats = {"rows": rows if rows is not None else next(values), "sampled": bool(sample), "columns": {}}
+    for column in columns:
+        column_stats = {"distinct": next(values)}
+        if ORDERABLE_TYPE.match(column["type"]):
+            column_stats["min"] = next(values)
+            column_stats["max"] = next(values)
+        stats["columns"][column["name"]] = column_stats
+
+    categorical = [column["name"] for column in columns
+                   if column["type"] == "VARCHAR" and stats["columns"][column["name"]]["distinct"] <= CATEGORICAL_MAX_DISTINCT]
+    if categorical:
+        sample_expressions = [f"list(DISTINCT {quote_identifier(name)}) FILTER (WHERE {quote_identifier(name)} IS NOT NULL)[1:{SAMPLE_VALUES}]"
+                              for name in categorical]
+        sample_row = cursor.execute(f"SELECT {', '.join(sample_expressions)} FROM (SELECT * FROM {table_name} LIMIT {SAMPLE_ROWS})").fetchone()
+        for name, samples in zip(categorical, sample_row):
+            stats["columns"][name]["samples"] = samples or []
+    return stats
+
+def _fetch_with_own_cursor(pool, database_name, table_key, table):
+    try:
+        with pool.cursor() as cursor:
+            return fetch_table_stats(cursor, database_name, table_key, table)
+    except Exception as e:
+        print(f"Could not collect statistics for {table_key}: {e}")
+        return None
+
+# Function to return statistics for the given tables, served from the TTL cache or collected in parallel
+def get_stats(pool, catalog, table_keys):
+    database_name = catalog["database"]
+    cache = _load_cache(database_name)
+    now = time.time()
+    tables = catalog["tables"]
+
+    stale = [key for key in table_keys
+             if key not in cache or cache[key]["hash"] != tables[key]["hash"] or now - cache[key]["fetched_at"] > SCHEMA_STATS_TTL]
+    if stale:
+        with ThreadPoolExecutor(max_workers=SCHEMA_STATS_WORKERS) as executor:
+            results = executor.map(lambda key: _fetch_with_own_cursor(pool, database_name, key, tables[key]), stale)
+            for key, stats in zip(stale, results):
+                if stats is not None:
+                    cache[key] = {"hash": tables[key]["hash"], "fetched_at": now, "stats": stats}
+        _save_cache(database_name, cache)
+
+    return {key: cache[key]["stats"] for key in table_keys if key in cache}
+
+def _short(value, max_length=30):
+    value = str(value)
+    return value if len(value) <= max_length else value[:max_length - 3] + "..."
+
+def render_stats(stats_by_table):
+    lines = []
+    for table_key, stats in stats_by_table.items():
+        parts = []
+        for column_name, column_stats in stats["columns"].items():
+            part = f"{column_name} ~{column_stats['distinct']} distinct"
+            if column_stats.get("min") is not None:
+                part += f" {_short(column_stats['min'])}..{_short(column_stats['max'])}"
+            if column_stats.get("samples"):
+                part += " e.g. " + ", ".join(f"'{_short(sample)}'" for sample in column_stats["samples"])
+            parts.append(part)
+        rows = f"~{stats['rows']} rows, sampled" if stats.get("sampled") else f"{stats['rows']} rows"
+        lines.append(f"-- {table_key} ({rows}): " + "; ".join(parts))
+    return "\n".join(lines)
@@ -0,0 +1,106 @@
+import copy
+import json
+import math
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+from cancellation import JobCancelled
+
+TELEMETRY_ENABLED = os.getenv('TELEMETRY', '1') == '1'
+TELEMETRY_LOG = os.getenv('TELEMETRY_LOG', '.cache/telemetry.jsonl')
+
+_write_lock = threading.Lock()
+
+def _write(span):
+    if not TELEMETRY_ENABLED:
+        return
+    with _write_lock:
+        os.makedirs(os.path.dirname(TELEMETRY_LOG) or ".", exist_ok=True)
+        with open(TELEMETRY_LOG, "a") as f:
+            f.write(json.dumps(span, default=str) + "\n")
+
+# Spans of one unit of work, e.g. a chat turn. Every finished span is appended to the JSONL log, one
+# object per line with OpenTelemetry-style fields (trace_id, span_id, name, start/end time, attributes, status).
+class Trace:
+    def __init__(self, name, **attributes):
+        self.trace_id = uuid.uuid4().hex
+        self.name = name
+        self.attributes = attributes
+        self.spans = []
+        self._lock = threading.Lock()
+
+    # Function to return a view of the trace that adds attributes to every span, e.g. the turn it belongs to
+    def bind(self, **attributes):
+        bound = copy.copy(self)
+        bound.attributes = {**self.attributes, **attributes}
+        return bound
+
+    def _record(self, name, start_time, duration_s, attributes, status="ok"):
+        span = {
+            "trace_id": self.trace_id,
+            "span_id": uuid.uuid4().hex[:16],
+            "trace_name": self.name,
+            "name": name,
+            "start_time": start_time,
+            "end_time": start_time + duration_s,
+            "duration_ms": round(duration_s * 1000, 3),
+            "status": status,
+            "attributes": {**self.attributes, **attributes},
+        }
+        with self._lock:
+            self.spans.append(span)
+        _write(span)
+        return span
+
+    # Context manager timing a block; the yielded dict takes attributes known only inside the block
+    @contextmanager
+    def span(self, name, **attributes):
+        start_time = time.time()
+        started = time.perf_counter()
+        status = "ok"
+        try:
+            yield attributes
+        except GeneratorExit:
+            # A stream that was closed early, e.g. a superseded candidate
+            status = "abandoned"
+            raise
+        except Exception as e:
+            status = "cancelled" if isinstance(e, JobCancelled) else "error"
+            attributes["error"] = str(e) or type(e).__name__
+            raise
+        finally:
+            self._record(name, start_time, time.perf_counter() - started, attributes, status)
+
+    # Function to record a span measured elsewhere, e.g. a build timed by the build server
+    def record(self, name, duration_ms, **attributes):
+        return self._record(name, time.time() - duration_ms / 1000, duration_ms / 1000, attributes)
+
+def _percentile(sorted_values, percentile):
+    # Nearest-rank percentile, exact enough for the handful of turns of a session
+    return sorted_values[max(0, math.ceil(percentile / 100 * len(sorted_values)) - 1)]
+
+# Function to summarize spans per name: count, p50 and p95 duration and, for LLM calls, token totals and hedged requests
+def summarize(spans):
+    by_name = {}
+    for span in spans:
+        by_name.setdefault(span["name"], []).append(span)
+    summary = {}
+    for name, named_spans in sorted(by_name.items()):
+        durations = sorted(span["duration_ms"] for span in named_spans)
+        entry = {"count": len(durations), "p50_ms": round(_percentile(durations, 50), 1), "p95_ms": round(_percentile(durations, 95), 1)}
+        for attribute in ("ttft_ms", "prompt_tokens", "completion_tokens"):
+            values = sorted(span["attributes"][attribute] for span in named_spans if span["attributes"].get(attribute) is not None)
+            if not values:
+                continue
+            if attribute == "ttft_ms":
+                entry.update(ttft_p50_ms=round(_percentile(values, 50), 1), ttft_p95_ms=round(_percentile(values, 95), 1))
+            else:
+                entry[attribute] = sum(values)
+        hedged = sum(1 for span in named_spans if span["attributes"].get("hedged"))
+        if hedged:
+            entry["hedged"] = hedged
+        summary[name] = entry
+    return summary
@@ -0,0 +1,20 @@
+import os
+import sys
+
+import duckdb
+import pytest
+
+# The modules of the generator are flat files next to this folder
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import connection_pool
+
+# A cursor pool over an in-memory database. Parametrize it indirectly with the SQL statements that set up
+# the database, e.g. pytestmark = pytest.mark.parametrize("pool", [SETUP], indirect=True)
+@pytest.fixture
+def pool(request):
+    conn = duckdb.connect()
+    for statement in getattr(request, "param", []):
+        conn.execute(statement)
+    yield connection_pool.CursorPool(conn)
+    conn.close()
@@ -0,0 +1,53 @@
+import argparse
+import glob
+import json
+import os
+
+import duckdb
+import httpx
+from openai import OpenAI
+
+import batch
+import response_cache
+
+SALES = "CREATE TABLE sales AS SELECT range AS order_id, 'region ' || (range % 3) AS region, range * 1.5 AS amount, " \
+        "DATE '2024-01-01' + range::INTEGER AS order_date FROM range(50)"
+
+def _args(**overrides):
+    args = dict(run_id="test", workers=2, timeout=60.0, no_build=True, no_cache=True, candidates=1, repair_attempts=0)
+    args.update(overrides)
+    return argparse.Namespace(**args)
+
+def test_stub_batch_without_builds(tmp_path, monkeypatch):
+    # Workspaces and caches are created relative to the working directory
+    monkeypatch.chdir(tmp_path)
+    for name in ("shop_east", "shop_west"):
+        with duckdb.connect(f"{name}.duckdb") as conn:
+            conn.execute(SALES)
+    connect = lambda: duckdb.connect("shop_east.duckdb").execute("ATTACH 'shop_west.duckdb'")
+    entries = [
+        {"name": "east", "database": "shop_east", "prompts": ["Create a sales dashboard", "Add a table of the largest orders"]},
+        {"name": "west", "database": "shop_west", "prompts": ["Create a sales dashboard"]},
+        {"name": "missing", "database": "shop_north", "prompts": ["Create a sales dashboard"]},
+    ]
+    servers = batch.start_stub_servers(os.path.join(batch.BASE_DIR, 'benchmark_data', 'completions.json'),
+                                       [entry["database"] for entry in entries])
+    clients = {name: OpenAI(api_key="test", base_url=server.base_url, http_client=httpx.Client()) for name, server in servers.items()}
+    try:
+        report = batch.run_batch(entries, clients, connect, _args())
+    finally:
+        for server in servers.values():
+            server.stop()
+
+    assert report["totals"] == {"entries": 3, batch.SUCCEEDED: 2, batch.BUILD_FAILED: 0, batch.FAILED: 1, batch.TIMED_OUT: 0}
+    east, west, missing = report["entries"]
+    assert [turn["status"] for turn in east["turns"]] == [batch.SUCCEEDED, batch.SUCCEEDED]
+    # Each entry's queries name its own database, so they pass the SQL validation without repairs
+    for entry in (east, west):
+        with open(os.path.join(entry["workspace"], "src", "components", "MyApp.jsx")) as f:
+            assert f"FROM {entry['database']}.main.sales" in f.read()
+        assert all(turn["error"] is None and turn["repair_attempts"] == 0 for turn in entry["turns"])
+    assert missing["status"] == batch.FAILED and "shop_north" in missing["error"] and missing["turns"] == []
+    # Skipped builds are not recorded as build outcomes of the cached responses
+    cached = [json.load(open(path)) for path in glob.glob(os.path.join(response_cache.RESPONSE_CACHE_DIR, "*.json"))]
+    assert cached and all(entry.get("build") is None for entry in cached)
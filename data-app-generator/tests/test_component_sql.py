@@ -0,0 +1,37 @@
+import pytest
+
+import component_sql
+
+with_orders = pytest.mark.parametrize("pool", [["CREATE TABLE orders (id INTEGER, status VARCHAR, \"order date\" DATE)"]], indirect=True)
+
+def test_decode_literal():
+    assert component_sql.decode_literal(r"it\'s \"q\" \\ \` a\nb A\x42\u{43}") == "it's \"q\" \\ ` a\nb ABC"
+    # Placeholders are JavaScript, their escapes are not part of the SQL
+    assert component_sql.decode_literal(r"WHERE a = '${names.join('\n')}' AND b = \'c\'") == \
+        r"WHERE a = '${names.join('\n')}' AND b = 'c'"
+
+def test_encode_literal_round_trip():
+    sql = 'SELECT "order date" FROM orders WHERE status = \'it\'\'s\'\n'
+    for quote_char in '\'"`':
+        assert component_sql.decode_literal(component_sql.encode_literal(sql, quote_char)) == sql
+
+@with_orders
+def test_escaped_quotes_are_valid_sql(pool):
+    component_code = r'''
+const statusQuery = 'SELECT count(*) FROM orders WHERE status = \'shipped\'';
+const dateQuery = "SELECT \"order date\" FROM orders";
+export default function MyApp() {
+  useEffect(() => { evaluateQuery(statusQuery); evaluateQuery(dateQuery); }, []);
+}
+'''
+    queries = component_sql.extract_queries(component_code)
+    assert [query.text for query in queries] == [
+        "SELECT count(*) FROM orders WHERE status = 'shipped'",
+        'SELECT "order date" FROM orders',
+    ]
+    assert component_sql.validate_component(pool, component_code) == []
+
+@with_orders
+def test_invalid_query_is_reported(pool):
+    errors = component_sql.validate_component(pool, "evaluateQuery('SELECT missing FROM orders')")
+    assert len(errors) == 1 and "missing" in errors[0]["message"]
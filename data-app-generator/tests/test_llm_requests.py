@@ -0,0 +1,85 @@
+import time
+
+import httpx
+import pytest
+from openai import OpenAI
+
+import benchmark
+import llm_requests
+
+COMPLETION = "<component>export default function MyApp() { return null }</component><summary>Empty app</summary>"
+
+@pytest.fixture(autouse=True)
+def hedging(monkeypatch):
+    monkeypatch.setattr(llm_requests, "_trackers", {})
+    monkeypatch.setattr(llm_requests, "LLM_HEDGING_ENABLED", True)
+    monkeypatch.setattr(llm_requests, "LLM_HEDGE_DEFAULT_DELAY", 0.3)
+    monkeypatch.setattr(llm_requests, "LLM_FALLBACK_MODEL", "")
+
+# A local stub of the completions endpoint, parametrized indirectly with its options, e.g. {"delays_ms": [3000, 0]}
+@pytest.fixture
+def stub(request):
+    server = benchmark.StubCompletionServer([COMPLETION], chunk_chars=20, **getattr(request, "param", {})).start()
+    yield server
+    server.stop()
+
+def _stream(stub, **options):
+    client = OpenAI(api_key="test", base_url=stub.base_url, max_retries=0, http_client=httpx.Client())
+    create = lambda model: client.chat.completions.create(model=model, messages=[{"role": "user", "content": "app"}], stream=True)
+    decisions = []
+    started = time.perf_counter()
+    chunks = llm_requests.hedged_stream(create, "primary-model", decisions=decisions, **options)
+    text = "".join(chunk.choices[0].delta.content or "" for chunk in chunks if chunk.choices)
+    return text, decisions, time.perf_counter() - started
+
+def _winner(decisions):
+    return next(d for d in decisions if d["decision"] == "winner")
+
+def test_fast_request_is_not_hedged(stub):
+    text, decisions, _ = _stream(stub)
+    assert text == COMPLETION
+    assert stub.requests == 1 and [d["decision"] for d in decisions] == ["winner"]
+    # The time to first token of the request is tracked
+    assert len(llm_requests.get_tracker("primary-model", "generate")._samples) == 1
+
+@pytest.mark.parametrize("stub", [{"delays_ms": [3000, 0]}], indirect=True)
+def test_slow_request_is_hedged_after_the_delay(stub):
+    text, decisions, elapsed = _stream(stub)
+    assert text == COMPLETION
+    assert [d["decision"] for d in decisions] == ["hedge", "winner"]
+    # Served by the hedge, so the slow request's time is not tracked
+    assert len(llm_requests.get_tracker("primary-model", "generate")._samples) == 0
+    assert decisions[0]["at_ms"] >= 300 and _winner(decisions)["attempt"] == "hedge"
+    assert stub.models == ["primary-model", "primary-model"]
+    assert elapsed < 2
+
+@pytest.mark.parametrize("stub", [{"delays_ms": [3000, 0]}], indirect=True)
+def test_hedge_goes_to_the_fallback_model(stub, monkeypatch):
+    monkeypatch.setattr(llm_requests, "LLM_FALLBACK_MODEL", "fallback-model")
+    text, decisions, _ = _stream(stub)
+    assert text == COMPLETION
+    assert stub.models == ["primary-model", "fallback-model"]
+    assert _winner(decisions)["model"] == "fallback-model"
+
+@pytest.mark.parametrize("stub", [{"failures": [0]}], indirect=True)
+def test_failing_primary_is_hedged_at_once(stub):
+    text, decisions, elapsed = _stream(stub)
+    assert text == COMPLETION
+    assert [d["decision"] for d in decisions] == ["error", "hedge", "winner"]
+    assert elapsed < 0.3
+
+@pytest.mark.parametrize("stub", [{"delays_ms": [3000]}], indirect=True)
+def test_deadline_ends_the_request(stub, monkeypatch):
+    monkeypatch.setattr(llm_requests, "LLM_HEDGING_ENABLED", False)
+    started = time.perf_counter()
+    with pytest.raises(llm_requests.DeadlineExceeded):
+        _stream(stub, deadline=time.monotonic() + 0.3)
+    assert time.perf_counter() - started < 1
+
+def test_hedge_delay_follows_the_fast_requests():
+    tracker = llm_requests.LatencyTracker()
+    assert tracker.hedge_delay() == llm_requests.LLM_HEDGE_DEFAULT_DELAY
+    # With a slow share above what the percentile leaves out, the delay is capped at a multiple of the median
+    for seconds in [0.4] * 8 + [3.0] * 2:
+        tracker.record(seconds)
+    assert tracker.hedge_delay() == pytest.approx(llm_requests.LLM_HEDGE_MEDIAN_FACTOR * 0.4)
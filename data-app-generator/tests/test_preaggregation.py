@@ -0,0 +1,63 @@
+import pytest
+
+import component_sql
+import preaggregation
+
+pytestmark = pytest.mark.parametrize("pool", [[
+    "CREATE TABLE events (id INTEGER, kind VARCHAR)",
+    "INSERT INTO events SELECT range, ['click', 'view', 'it''s'][range % 3 + 1] FROM range(300)",
+]], indirect=True)
+
+DATABASE = "memory"
+# Quotes of every kind, so the literal needs escaping in each quote style
+SQL = "SELECT \"kind\", count(*) AS n FROM events WHERE kind <> 'it''s' GROUP BY \"kind\" ORDER BY \"kind\""
+
+@pytest.fixture(autouse=True)
+def manifest(tmp_path, monkeypatch):
+    monkeypatch.setattr(preaggregation, "PREAGGREGATION_MANIFEST", str(tmp_path / "preaggregations.json"))
+    monkeypatch.setattr(preaggregation, "PREAGGREGATION_MIN_SCAN_ROWS", 1)
+
+def _query(pool, sql):
+    with pool.cursor() as cursor:
+        return cursor.execute(sql).fetchall()
+
+@pytest.mark.parametrize("call", ["evaluateQuery", "useQuery"])
+@pytest.mark.parametrize("quote_char", ["'", '"', "`"])
+def test_aggregation_is_materialized_and_read(pool, call, quote_char):
+    component_code = f"const {{ data }} = {call}({quote_char}{component_sql.encode_literal(SQL, quote_char)}{quote_char});"
+    rewritten, entries = preaggregation.apply_preaggregations(pool, DATABASE, component_code)
+
+    assert len(entries) == 1 and entries[0]["rows"] == 2
+    assert preaggregation.PREAGGREGATION_SCHEMA in rewritten
+    assert list(preaggregation.load_manifest()) == [f"{DATABASE}.{preaggregation.PREAGGREGATION_SCHEMA}.{entries[0]['table']}"]
+    assert component_sql.validate_component(pool, rewritten) == []
+    [query] = component_sql.extract_queries(rewritten)
+    assert _query(pool, query.text) == _query(pool, SQL) == [("click", 100), ("view", 100)]
+
+def test_queries_with_placeholders_or_without_aggregation_are_kept(pool):
+    component_code = "evaluateQuery(`SELECT kind, count(*) FROM events WHERE id > ${minId} GROUP BY kind`); evaluateQuery('SELECT * FROM events')"
+    assert preaggregation.apply_preaggregations(pool, DATABASE, component_code) == (component_code, [])
+
+def test_large_results_keep_the_original_query(pool, monkeypatch):
+    monkeypatch.setattr(preaggregation, "PREAGGREGATION_MAX_ROWS", 1)
+    component_code = f"evaluateQuery('{component_sql.encode_literal(SQL, chr(39))}')"
+    assert preaggregation.apply_preaggregations(pool, DATABASE, component_code) == (component_code, [])
+    assert preaggregation.load_manifest() == {}
+    # The table that was too large is dropped again
+    assert _query(pool, f"SELECT count(*) FROM duckdb_tables() WHERE schema_name = '{preaggregation.PREAGGREGATION_SCHEMA}'") == [(0,)]
+
+def test_refresh_recomputes_the_tables(pool):
+    _, [entry] = preaggregation.apply_preaggregations(pool, DATABASE, f"evaluateQuery(`{SQL}`)")
+    _query(pool, "INSERT INTO events SELECT 1000 + range, 'scroll' FROM range(5)")
+    with pool.cursor() as cursor:
+        refreshed = preaggregation.refresh(cursor, DATABASE)
+
+    key = f"{DATABASE}.{preaggregation.PREAGGREGATION_SCHEMA}.{entry['table']}"
+    assert refreshed == [key]
+    assert preaggregation.load_manifest()[key]["rows"] == 3
+    assert preaggregation.load_manifest()[key]["refreshed_at"] >= entry["refreshed_at"]
+    table = preaggregation.qualified_table(DATABASE, entry["table"])
+    assert _query(pool, f"SELECT * FROM {table}") == [("click", 100), ("scroll", 5), ("view", 100)]
+    # Tables of other databases are left alone
+    with pool.cursor() as cursor:
+        assert preaggregation.refresh(cursor, "other") == []
@@ -0,0 +1,36 @@
+import pytest
+
+import query_budget
+
+pytestmark = pytest.mark.parametrize("pool", [[
+    "CREATE TABLE events (id INTEGER, kind VARCHAR, created_at TIMESTAMP)",
+    "INSERT INTO events SELECT range, 'click', TIMESTAMP '2024-01-01' + INTERVAL (range) SECOND FROM range(100000)",
+]], indirect=True)
+
+def test_raw_rows_are_sampled_to_the_row_budget(pool):
+    code, findings = query_budget.enforce_budget(pool, "evaluateQuery('SELECT id, kind FROM events')")
+    assert [finding["action"] for finding in findings] == ["sampled rows"]
+    assert f"USING SAMPLE {query_budget.QUERY_BUDGET_MAX_ROWS} ROWS" in code
+
+def test_ordered_rows_are_limited(pool):
+    code, findings = query_budget.enforce_budget(pool, "evaluateQuery('SELECT id FROM events ORDER BY created_at')")
+    assert [finding["action"] for finding in findings] == ["limited"]
+    assert f"LIMIT {query_budget.QUERY_BUDGET_MAX_ROWS}" in code
+
+def test_placeholder_query_is_rewritten(pool):
+    # The unquoted placeholder plans when filled with nothing, not with a value
+    component_code = "evaluateQuery(`SELECT id, kind FROM events ${filter}`)"
+    code, findings = query_budget.enforce_budget(pool, component_code)
+    assert [finding["action"] for finding in findings] == ["sampled rows"]
+    assert code == f"evaluateQuery(`SELECT * FROM (SELECT id, kind FROM events ${{filter}}) AS budgeted " \
+                   f"/* sampled to the row budget */ USING SAMPLE {query_budget.QUERY_BUDGET_MAX_ROWS} ROWS`)"
+
+def test_aggregations_are_not_rewritten(pool):
+    component_code = "evaluateQuery('SELECT kind, count(*) FROM events GROUP BY kind')"
+    assert query_budget.enforce_budget(pool, component_code) == (component_code, [])
+
+def test_placeholder_value_query_is_rewritten(pool):
+    # The unquoted placeholder plans when filled with a value, not with nothing
+    code, findings = query_budget.enforce_budget(pool, "evaluateQuery(`SELECT id FROM events WHERE id >= ${minId} ORDER BY id`)")
+    assert [finding["action"] for finding in findings] == ["limited"]
+    assert "${minId}" in code and f"LIMIT {query_budget.QUERY_BUDGET_MAX_ROWS}" in code
@@ -0,0 +1,34 @@
+import pytest
+
+import schema_stats
+
+pytestmark = pytest.mark.parametrize("pool", [[
+    "CREATE TABLE orders AS SELECT range AS id, ['north', 'south'][range % 2 + 1] AS region, range * 0.5 AS amount FROM range(200000)",
+    "CREATE VIEW recent_orders AS SELECT * FROM orders WHERE id >= 150000",
+]], indirect=True)
+
+ORDERS = {"columns": [{"name": "id", "type": "BIGINT"}, {"name": "region", "type": "VARCHAR"}, {"name": "amount", "type": "DOUBLE"}]}
+
+def test_large_tables_use_the_row_estimate_and_a_sample(pool, monkeypatch):
+    monkeypatch.setattr(schema_stats, "SCHEMA_STATS_SAMPLE_ROWS", 20000)
+    with pool.cursor() as cursor:
+        stats = schema_stats.fetch_table_stats(cursor, "memory", "main.orders", ORDERS)
+    assert stats["rows"] == 200000 and stats["sampled"]
+    # A sample of about 20000 rows sees far fewer distinct ids than the table has
+    assert stats["columns"]["id"]["distinct"] < 100000
+    assert sorted(stats["columns"]["region"]["samples"]) == ["north", "south"]
+    assert "(~200000 rows, sampled)" in schema_stats.render_stats({"main.orders": stats})
+
+def test_small_tables_are_read_whole(pool, monkeypatch):
+    monkeypatch.setattr(schema_stats, "SCHEMA_STATS_SAMPLE_ROWS", 1000000)
+    with pool.cursor() as cursor:
+        stats = schema_stats.fetch_table_stats(cursor, "memory", "main.orders", ORDERS)
+    assert not stats["sampled"]
+    assert stats["columns"]["id"]["min"] == "0" and stats["columns"]["id"]["max"] == "199999"
+
+def test_views_are_counted(pool, monkeypatch):
+    monkeypatch.setattr(schema_stats, "SCHEMA_STATS_SAMPLE_ROWS", 20000)
+    with pool.cursor() as cursor:
+        stats = schema_stats.fetch_table_stats(cursor, "memory", "main.recent_orders", ORDERS)
+    assert stats["rows"] == 50000 and not stats["sampled"]
+    assert stats["columns"]["id"]["min"] == "150000"
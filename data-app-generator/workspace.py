@@ -0,0 +1,86 @@
+import os
+import re
+import shutil
+import time
+
+from component_history import HISTORY_DIR
+
+WORKSPACES_DIR = os.getenv('WORKSPACES_DIR', '.workspaces')
+WORKSPACE_IDLE_TTL = int(os.getenv('WORKSPACE_IDLE_TTL', str(24 * 3600)))
+SCAFFOLD_DIR = 'my-app'
+
+LAST_USED_MARKER = '.last_used'
+# Not copied into workspaces; node_modules is shared through a symlink
+SKIPPED_ENTRIES = {'node_modules', 'dist', '.cursorrules', LAST_USED_MARKER, HISTORY_DIR}
+def _populate(workspace_dir, scaffold_dir):
+    for root, dirs, files in os.walk(scaffold_dir):
+        relative_root = os.path.relpath(root, scaffold_dir)
+        if relative_root == '.':
+            dirs[:] = [d for d in dirs if d not in SKIPPED_ENTRIES]
+            files = [f for f in files if f not in SKIPPED_ENTRIES]
+        os.makedirs(os.path.join(workspace_dir, relative_root), exist_ok=True)
+        for name in files:
+            relative_path = os.path.normpath(os.path.join(relative_root, name))
+            # Copied, not hardlinked: a workspace is edited in place, e.g. in Cursor, without touching the scaffold.
+            # copy2 keeps the modification times, which the artifact cache keys builds on.
+            shutil.copy2(os.path.join(root, name), os.path.join(workspace_dir, relative_path))
+
+    node_modules = os.path.abspath(os.path.join(scaffold_dir, 'node_modules'))
+    if os.path.isdir(node_modules):
+        os.symlink(node_modules, os.path.join(workspace_dir, 'node_modules'), target_is_directory=True)
+
+def touch_workspace(workspace_dir):
+    with open(os.path.join(workspace_dir, LAST_USED_MARKER), 'w') as f:
+        f.write(str(time.time()))
+
+# Function to return the workspace of a session, creating it from the app scaffold on first use.
+# Workspaces copy the scaffold's few source and config files and share its node_modules, so creating one is cheap.
+def create_workspace(workspace_id, scaffold_dir=SCAFFOLD_DIR):
+    workspace_dir = os.path.join(WORKSPACES_DIR, re.sub(r'[^A-Za-z0-9_-]', '_', workspace_id))
+    if not os.path.isdir(workspace_dir):
+        if not os.path.isdir(scaffold_dir):
+            raise FileNotFoundError(f"App scaffold not found: {scaffold_dir}")
+        tmp_dir = f"{workspace_dir}.tmp{os.getpid()}"
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        _populate(tmp_dir, scaffold_dir)
+        try:
+            os.rename(tmp_dir, workspace_dir)
+        except OSError:
+            # Created concurrently by another thread
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+    touch_workspace(workspace_dir)
+    return workspace_dir
+
+# Function to return a scratch copy of a workspace, e.g. to build candidate components side by side
+def create_scratch_workspace(workspace_dir, name):
+    return create_workspace(f"{os.path.basename(os.path.normpath(workspace_dir))}-{name}", scaffold_dir=workspace_dir)
+
+def last_used(workspace_dir):
+    try:
+        return os.path.getmtime(os.path.join(workspace_dir, LAST_USED_MARKER))
+    except OSError:
+        return os.path.getmtime(workspace_dir)
+
+# Function to remove workspaces that have not been used for WORKSPACE_IDLE_TTL seconds.
+# on_remove is called with the workspace directory before it is deleted, e.g. to stop its processes.
+def collect_garbage(keep=(), on_remove=None, idle_ttl=WORKSPACE_IDLE_TTL):
+    if not os.path.isdir(WORKSPACES_DIR):
+        return []
+    keep = {os.path.normpath(path) for path in keep}
+    removed = []
+    now = time.time()
+    for name in os.listdir(WORKSPACES_DIR):
+        workspace_dir = os.path.join(WORKSPACES_DIR, name)
+        if not os.path.isdir(workspace_dir) or os.path.normpath(workspace_dir) in keep:
+            continue
+        try:
+            if now - last_used(workspace_dir) < idle_ttl:
+                continue
+        except OSError:
+            continue
+        if on_remove is not None:
+            on_remove(workspace_dir)
+        # The node_modules symlink is removed, not followed
+        shutil.rmtree(workspace_dir, ignore_errors=True)
+        removed.append(workspace_dir)
+    return removed